@@ -6,6 +6,19 @@ import logging
 # my lib
 from src import base_station
 from src import summary
+from src import file_parser
+from src import http_client
+from src import utils
+from src import url_scoring
+from src import segment_store
+from src import text_processing
+from src import parse_pool
+from src import pipeline
+from src import inverted_index
+from src import query_engine
+from src import crawl_state
+from src import near_duplicates
+from src import crawler
 
 __author__ = 'LJ Brown'
 __version__ = "1.0.1"
@@ -23,17 +36,121 @@ logger.addHandler(logging.StreamHandler(sys.stdout))
 SEED_URL = "http://lyle.smu.edu/~fmoore/"
 MAX_URLS_TO_INDEX = None
 STOPWORDS_FILE = "stopwords.txt"
+PARSER_BACKEND = file_parser.DEFAULT_PARSER_BACKEND
+WORKERS = 1
+USER_AGENT = http_client.DEFAULT_USER_AGENT
+RESOLVE_METHOD = "head"
+RESOLVE_WORKERS = 8
+FRONTIER = "fifo"
+SCORING_CRITERIA = ["depth"]
+FRONTIER_MEMORY_LIMIT = 100000
+SNAPSHOT_INTERVAL = 100
+WRITE_BATCH_SIZE = 1
+STORAGE = "files"
+TOKENIZER = text_processing.DEFAULT_TOKENIZER
+PARSE_PROCESSES = 0
+PARSE_CHUNK_SIZE = parse_pool.DEFAULT_CHUNK_SIZE
+EXTRACT_WORKERS = 2
+TOKENIZE_WORKERS = 2
+QUEUE_SIZE = pipeline.DEFAULT_QUEUE_SIZE
+TOP_K = query_engine.DEFAULT_TOP_K
+SCORING = query_engine.DEFAULT_SCORING
+NEAR_DUPLICATE_THRESHOLD = near_duplicates.DEFAULT_THRESHOLD
+HASH_ALGORITHM = crawler.DEFAULT_HASH_ALGORITHM
 
-parser = argparse.ArgumentParser( description='Scrape A Website.' )
-parser.add_argument('-n', '--number', help='Maximum number of files to index. Will Crawl every page by default.', type=int, default=MAX_URLS_TO_INDEX)
-parser.add_argument('-o', '--output', help='Output file name', required=True, type=str)
-parser.add_argument('-i', '--input', help='Stopwords File path. Format: one word per line .txt file.', type=str, default=STOPWORDS_FILE)
-parser.add_argument('-u', '--url', help='Website to crawl and index.', type=str, default=SEED_URL)
-args = parser.parse_args()
 
-# crawl site
-bs = base_station.Base_Station()
-bs.scrape_website(seed_url=args.url, output_directory=args.output, max_urls_to_index=args.number, stopwords_file=args.input)
+def main():
+    parser = argparse.ArgumentParser( description='Scrape A Website.' )
+    parser.add_argument('-n', '--number', help='Maximum number of files to index. Will Crawl every page by default.', type=int, default=MAX_URLS_TO_INDEX)
+    parser.add_argument('-o', '--output', help='Output file name', required=True, type=str)
+    parser.add_argument('-i', '--input', help='Stopwords File path. Format: one word per line .txt file.', type=str, default=STOPWORDS_FILE)
+    parser.add_argument('-u', '--url', help='Website to crawl and index.', type=str, default=SEED_URL)
+    parser.add_argument('-p', '--parser', help='HTML parser backend.', type=str, choices=file_parser.parser_backends(), default=PARSER_BACKEND)
+    parser.add_argument('-t', '--tokenizer', help='Word tokenizer. "regex" is several times faster than "nltk" and needs no nltk tokenizer data, but treats abbreviations ending in a period as the end of a sentence.', type=str, choices=text_processing.tokenizers(), default=TOKENIZER)
+    parser.add_argument('-w', '--workers', help='Number of pages to fetch concurrently. Crawls one page at a time by default.', type=int, default=WORKERS)
+    parser.add_argument('--parse-processes', help='Number of worker processes that parse and tokenize fetched pages, use the number of cores to keep every core busy. Pages are parsed on the crawl threads by default.', type=int, default=PARSE_PROCESSES)
+    parser.add_argument('--parse-chunk-size', help='Maximum number of pages sent to a parse process at once while every process is busy.', type=int, default=PARSE_CHUNK_SIZE)
+    parser.add_argument('--pipeline', help='Crawl as stages connected by bounded queues: fetch (--workers threads), extract, dedup, tokenize and persist. Queue depths are logged to show the slowest stage.', action='store_true')
+    parser.add_argument('--extract-workers', help='With --pipeline, number of threads parsing pages. With --parse-processes, should be at least the number of processes.', type=int, default=EXTRACT_WORKERS)
+    parser.add_argument('--tokenize-workers', help='With --pipeline, number of threads tokenizing pages.', type=int, default=TOKENIZE_WORKERS)
+    parser.add_argument('--queue-size', help='With --pipeline, maximum number of pages waiting for each stage.', type=int, default=QUEUE_SIZE)
+    parser.add_argument('--pool-size', help='Keep alive connections per host. Defaults to the largest of 10, --workers and --resolve-workers.', type=int, default=None)
+    parser.add_argument('--user-agent', help='User-Agent header sent with every request.', type=str, default=USER_AGENT)
+    parser.add_argument('--timeout', help='Request timeout in seconds. Waits forever by default.', type=float, default=None)
+    parser.add_argument('--resolve-method', help='How links are resolved to their final url. "head" and "stream" never download the body.', type=str, choices=utils.URL_Resolver.resolution_methods(), default=RESOLVE_METHOD)
+    parser.add_argument('--resolve-workers', help='Number of links resolved concurrently.', type=int, default=RESOLVE_WORKERS)
+    parser.add_argument('--frontier', help='Crawl order. "fifo" is breadth first, "disk" is breadth first spilling to disk past --frontier-memory urls, "priority" crawls the best scoring urls first.', type=str, choices=["fifo", "disk", "priority"], default=FRONTIER)
+    parser.add_argument('--frontier-memory', help='With the disk frontier, maximum number of queued urls held in memory.', type=int, default=FRONTIER_MEMORY_LIMIT)
+    parser.add_argument('--score', help='Criteria added together to score urls for the priority frontier, lower is crawled first.', type=str, nargs='+', choices=url_scoring.scoring_criteria(), default=SCORING_CRITERIA)
+    parser.add_argument('--directory-budget', help='With the priority frontier, defer urls from directories that have already had this many urls crawled.', type=int, default=None)
+    parser.add_argument('--snapshot-interval', help='Pages between checks for snapshots of the id maps and crawl state. New entries are journaled after every page, and a journal is compacted into a full snapshot once it has grown past half of its last snapshot.', type=int, default=SNAPSHOT_INTERVAL)
+    parser.add_argument('--write-batch', help='Number of web page summary and document files buffered and written together. A crash loses at most this many. Writes through by default.', type=int, default=WRITE_BATCH_SIZE)
+    parser.add_argument('--storage', help='Write one json file per web page summary and document, or append them to packed segment files.', type=str, choices=["files", "segments"], default=STORAGE)
+    parser.add_argument('--dense-matrix', help='Write the document term frequency matrix as a dense csv with a column per term, instead of (document_id, term, frequency) rows. Needs memory for every document and term pair.', action='store_true')
+    parser.add_argument('--content-hash', help='Hash of the downloaded page bytes used to detect duplicate content, computed while the page downloads. --recrawl must use the hash the crawl was made with.', type=str, choices=crawler.hash_algorithms(), default=HASH_ALGORITHM)
+    parser.add_argument('--parse-duplicates', help='Parse pages whose content is already indexed and follow their links. By default they are reported without parsing, and their links are not followed.', action='store_true')
+    parser.add_argument('--near-duplicates', help='Do not save documents whose SimHash similarity to a saved document is at least THRESHOLD (0 to 1, %s if not given). Pages differing only in a timestamp or navigation bar are then counted as one document.' % NEAR_DUPLICATE_THRESHOLD, type=float, nargs='?', const=NEAR_DUPLICATE_THRESHOLD, default=None, metavar='THRESHOLD')
+    parser.add_argument('--recrawl', help='Refresh an earlier crawl of --output. Indexed pages are requested again with If-None-Match / If-Modified-Since, unchanged pages are not parsed again and only pages whose content changed are tokenized and saved.', action='store_true')
+    parser.add_argument('--resume', help='Continue the stopped crawl of --output where it stopped, with the options it was started with. Other crawl options are ignored.', action='store_true')
+    parser.add_argument('--online-report', help='Resolve links the crawl never resolved over the network for the summary report. By default the report only uses the saved resolutions and lists the rest as unresolved.', action='store_true')
+    parser.add_argument('--index', help='After the crawl, merge new documents into the inverted index of --output.', action='store_true')
+    parser.add_argument('--build-index', help='Merge the documents of --output not yet in its inverted index into the index, then exit.', action='store_true')
+    parser.add_argument('-q', '--query', help='Search the inverted index of --output instead of crawling, and print the best matching urls.', type=str, default=None)
+    parser.add_argument('-k', '--top-k', help='Number of results for --query.', type=int, default=TOP_K)
+    parser.add_argument('--scoring', help='Ranking function for --query.', type=str, choices=query_engine.scoring_methods(), default=SCORING)
+    parser.add_argument('--convert-to-segments', help='Pack the web page summary and document files of --output into segment files, then exit.', action='store_true')
+    args = parser.parse_args()
 
-# display summary and write term frequency matrix to output file
-summary.display_summary(args.output)
\ No newline at end of file
+    # convert an existing crawl and exit
+    if args.convert_to_segments:
+        segment_store.convert_directory(args.output)
+        sys.exit(0)
+
+    # build or update the inverted index and exit
+    if args.build_index:
+        inverted_index.build_index(args.output, summary.load_document_frequency_dicts(args.output))
+        sys.exit(0)
+
+    # search the index and exit
+    if args.query is not None:
+        engine = query_engine.Query_Engine(args.output, tokenizer=args.tokenizer, scoring=args.scoring)
+        for rank, result in enumerate(engine.search(args.query, args.top_k), 1):
+            print("%d\t%.4f\t%s" % (rank, result['score'], ' '.join(result['urls']) or "document %d" % result['document_id']))
+        engine.close()
+        sys.exit(0)
+
+    # shared http connection pool
+    pool_size = args.pool_size if args.pool_size is not None else max(http_client.DEFAULT_POOL_MAXSIZE, args.workers, args.resolve_workers)
+    http_client.configure(pool_maxsize=pool_size, user_agent=args.user_agent, timeout=args.timeout)
+
+    # crawl site, or continue a stopped crawl with its saved parameters
+    bs = base_station.Base_Station()
+    if args.resume:
+        config = crawl_state.crawl_state(args.output).load_config()
+        if config is None:
+            logger.error("No crawl of %s to resume" % args.output)
+            sys.exit(1)
+        bs.scrape_website(resume=True, **config)
+    else:
+        bs.scrape_website(seed_url=args.url, output_directory=args.output, max_urls_to_index=args.number, stopwords_file=args.input, parser_backend=args.parser, workers=args.workers,
+                          resolve_method=args.resolve_method, resolve_workers=args.resolve_workers,
+                          frontier=args.frontier, scoring_criteria=args.score, directory_budget=args.directory_budget,
+                          frontier_memory_limit=args.frontier_memory,
+                          snapshot_interval=args.snapshot_interval, write_batch_size=args.write_batch,
+                          storage=args.storage, tokenizer=args.tokenizer,
+                          parse_processes=args.parse_processes, parse_chunk_size=args.parse_chunk_size,
+                          use_pipeline=args.pipeline, extract_workers=args.extract_workers, tokenize_workers=args.tokenize_workers,
+                          queue_size=args.queue_size, recrawl=args.recrawl, near_duplicate_threshold=args.near_duplicates,
+                          hash_algorithm=args.content_hash, parse_duplicates=args.parse_duplicates)
+
+    # add new documents to the inverted index
+    if args.index:
+        inverted_index.build_index(args.output, summary.load_document_frequency_dicts(args.output))
+
+    # display summary and write term frequency matrix to output file
+    summary.display_summary(args.output, dense=args.dense_matrix, online=args.online_report)
+
+
+# worker processes of the parse pool import this module, the crawl must only run when it is executed
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+
+__author__ = "L.J. Brown"
+__version__ = "1.0.1"
+
+import argparse
+import os
+import sys
+import time
+
+# run from the webcrawler directory, like __main__.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# my lib
+from src import utils
+
+"""
+    URL Frontier Benchmark
+
+    Times utils.URL_Frontier the way a crawl uses it: 1.5n adds of which a third repeat a queued url
+    (the duplicate check in add), then n remove and len pairs (Base_Station.continue_indexing calls len before
+    every remove). With constant time operations the time per operation stays flat as n grows.
+
+    use:
+        python benchmarks/frontier_benchmark.py
+        python benchmarks/frontier_benchmark.py --sizes 100000 1000000 3000000
+"""
+
+SIZES = [10000, 100000, 1000000]
+
+
+def make_urls(n):
+    return ["http://example.com/directory_%d/page_%d.html" % (i % 1000, i) for i in range(n)]
+
+
+def benchmark_frontier(n):
+    """ Returns seconds for the adds and for the remove and len pairs of a frontier of n urls. """
+    urls = make_urls(n)
+    added_urls = urls + urls[::2]
+
+    frontier = utils.URL_Frontier()
+    start = time.perf_counter()
+    for url in added_urls:
+        frontier.add(url)
+    add_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    while len(frontier) > 0:
+        frontier.remove()
+    remove_seconds = time.perf_counter() - start
+
+    return add_seconds, remove_seconds
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Time URL_Frontier operations for growing numbers of queued urls.')
+    parser.add_argument('--sizes', help='Numbers of queued urls to time.', type=int, nargs='+', default=SIZES)
+    args = parser.parse_args()
+
+    print("%10s %10s %12s %14s %12s" % ("urls", "add s", "add us/op", "remove+len s", "remove us/op"))
+    for n in args.sizes:
+        add_seconds, remove_seconds = benchmark_frontier(n)
+        print("%10d %10.2f %12.3f %14.2f %12.3f" % (n, add_seconds, add_seconds / (1.5 * n) * 1e6,
+                                                    remove_seconds, remove_seconds / n * 1e6))
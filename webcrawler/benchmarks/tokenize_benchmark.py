@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+
+__author__ = "L.J. Brown"
+__version__ = "1.0.1"
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+# run from the webcrawler directory, like __main__.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# external
+import nltk
+from nltk.stem import PorterStemmer
+
+# my lib
+from src import text_processing
+
+"""
+    Tokenization Benchmark
+
+    Times text_processing.plain_text_to_tokens against the original multi pass version kept below, over the
+    documents stored in collected_data. Documents are saved as term frequency dictionaries, so each one is
+    expanded back into text, every term repeated by its frequency, with stop words mixed in to be filtered.
+    Both versions must return the same tokens, with nltk stop words and with a stopwords file.
+
+    use:
+        python benchmarks/tokenize_benchmark.py
+        python benchmarks/tokenize_benchmark.py --corpus collected_data --stopwords stopwords.txt --repeat 3
+"""
+
+CORPUS_DIRECTORY = "collected_data"
+STOPWORDS_FILE = "stopwords.txt"
+REPEAT = 1
+
+
+# original plain_text_to_tokens, one list comprehension per filter
+
+def original_is_stopword(word):
+    stop_words = nltk.corpus.stopwords.words('english')
+    return word in stop_words
+
+
+def original_list_from_stopwords_file(stopwords_file):
+    with open(stopwords_file) as sf:
+        plain_text = sf.read()
+    return original_plain_text_to_tokens(plain_text)
+
+
+def original_is_number(word):
+    try:
+        float(word)
+        return True
+    except ValueError:
+        pass
+    try:
+        import unicodedata
+        unicodedata.numeric(word)
+        return True
+    except (TypeError, ValueError):
+        pass
+    return False
+
+
+def original_stem(word):
+    ps = PorterStemmer()
+    return ps.stem(word)
+
+
+def original_plain_text_to_tokens(plain_text, stopwords_file=None):
+    tokens = nltk.word_tokenize(plain_text)
+    tokens = [t.lower() for t in tokens]
+    tokens = [w for w in tokens if text_processing.alphabetic_start(w)]
+    tokens = [w for w in tokens if text_processing.alphanumeric_end(w)]
+    if stopwords_file is None:
+        tokens = [w for w in tokens if not original_is_stopword(w)]
+    else:
+        stopwords = original_list_from_stopwords_file(stopwords_file)
+        tokens = [w for w in tokens if w not in stopwords]
+    tokens = [w for w in tokens if not text_processing.is_punctuation(w)]
+    tokens = [w for w in tokens if not text_processing.is_shorter(w)]
+    tokens = [w for w in tokens if not original_is_number(w)]
+    return list(map(original_stem, tokens))
+
+
+# corpus
+
+def load_corpus(corpus_directory, stopwords_file):
+    """ Returns one text per stored document, its terms repeated by frequency with stop words between them. """
+    with open(stopwords_file) as sf:
+        stopwords = sf.read().split()
+    stopwords += sorted(text_processing.english_stopwords())
+
+    texts = []
+    document_files = glob.glob(os.path.join(corpus_directory, "*", "documents", "*.json"))
+    for document_file in sorted(document_files):
+        with open(document_file) as df:
+            term_frequency_dict = json.load(df)['term_frequency_dict']
+        words = []
+        for term, frequency in sorted(term_frequency_dict.items()):
+            for _ in range(frequency):
+                words.append(term)
+                words.append(stopwords[len(words) % len(stopwords)])
+        texts.append(' '.join(words) + '.')
+    return texts
+
+
+def time_tokenize(plain_text_to_tokens, texts, stopwords_file, repeat):
+    """ Returns the best seconds of repeat runs over every text, and the tokens of the last run. """
+    best_seconds = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        tokens = [plain_text_to_tokens(text, stopwords_file) for text in texts]
+        seconds = time.perf_counter() - start
+        if best_seconds is None or seconds < best_seconds:
+            best_seconds = seconds
+    return best_seconds, tokens
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Time plain_text_to_tokens against the original version over a stored corpus.')
+    parser.add_argument('--corpus', help='Directory of crawls, every <crawl>/documents/*.json is tokenized.', type=str, default=CORPUS_DIRECTORY)
+    parser.add_argument('--stopwords', help='Stopwords file timed as the second case.', type=str, default=STOPWORDS_FILE)
+    parser.add_argument('--repeat', help='Runs per case, the fastest is reported.', type=int, default=REPEAT)
+    args = parser.parse_args()
+
+    texts = load_corpus(args.corpus, args.stopwords)
+    print("%d documents, %d words" % (len(texts), sum(len(text.split()) for text in texts)))
+
+    print("%-16s %12s %12s %8s %10s" % ("stop words", "original s", "current s", "speedup", "tokens"))
+    for name, stopwords_file in (("nltk english", None), (os.path.basename(args.stopwords), args.stopwords)):
+        original_seconds, original_tokens = time_tokenize(original_plain_text_to_tokens, texts, stopwords_file, args.repeat)
+        current_seconds, current_tokens = time_tokenize(text_processing.plain_text_to_tokens, texts, stopwords_file, args.repeat)
+        print("%-16s %12.3f %12.3f %7.1fx %10s" % (name, original_seconds, current_seconds, original_seconds / current_seconds,
+                                                   "same" if original_tokens == current_tokens else "DIFFERENT"))
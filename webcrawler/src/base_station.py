@@ -1,11 +1,23 @@
+import collections
 import logging
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 # my lib
 from src import utils
 from src import file_io
 from src import crawler
 from src import robot_parser
+from src import url_scoring
+from src import segment_store
+from src import parse_pool
+from src import pipeline
+from src import file_parser
+from src import text_processing
+from src import crawl_dataset
+from src import crawl_state
+from src import near_duplicates
 
 # logging
 logging.basicConfig(level=logging.INFO)
@@ -13,11 +25,15 @@ logger = logging.getLogger(__name__)
 logger.addHandler(logging.FileHandler("output/output_log.txt"))
 logger.addHandler(logging.StreamHandler(sys.stdout))
 
+# pages between logs of the pipeline queue depths
+PIPELINE_STATUS_INTERVAL = 25
+
 class URL_Indexer():
 
     def __init__(self):
         self.url_resolver = utils.URL_Resolver()
         self.url_id_index = utils.Incremental_Hash_ID()
+        self.summary_store = None
 
     def get_url_id_dict(self):
         return self.url_id_index.to_dict()
@@ -42,31 +58,36 @@ class URL_Indexer():
     def resolve_url_list(self, url_list):
         return self.url_resolver.resolve_list(url_list)
 
-    def add_web_page_summary(self, web_page_summary, output_directory_name):
-        """ Resolves web page links, Indexes and writes web page summary only if resolved requested url is not in index."""
-
-        # resolved requested url
-        requested_url = web_page_summary['requested_url']
+    def index_url(self, requested_url, replace=False):
+        """ Resolves requested url and adds it to index. Returns the resolved url, or None if it was already in index.
+            With replace, a url already in index is returned too, so its summary is written again under its url id. """
         resolved_requested_url = self.url_resolver.resolve(requested_url)
 
         # check if resolved requested url is in index. if it is, return
         if resolved_requested_url in self.url_id_index:
-            return
+            if not replace:
+                return None
+            logger.info("Updating URL in index: %s" % resolved_requested_url)
+        else:
+            logger.info("Adding new URL to index: %s" % resolved_requested_url)
 
-        logger.info("Adding new URL to index: %s" % resolved_requested_url)
+            # add new url to index
+            self.url_id_index.add(resolved_requested_url)
 
-        # add new url to index
-        self.url_id_index.add(resolved_requested_url)
+        return resolved_requested_url
 
-        # if not in index, resolve all web page links and write to file
+    def save_web_page_summary(self, web_page_summary, resolved_requested_url, output_directory_name):
+        """ Writes web page summary of an indexed url. Links are written as resolved when they were resolved
+            already (links the crawl may follow, see Base_Station.update_frontier), other links as found,
+            so out of bounds, robots disallowed and image links cost no requests. """
 
         # and if has attributes
         resolved_normalized_a_hrefs = []
         if 'normalized_a_hrefs' in web_page_summary:
-            resolved_normalized_a_hrefs = self.url_resolver.resolve_list(web_page_summary['normalized_a_hrefs'])
+            resolved_normalized_a_hrefs = self.url_resolver.lookup_list(web_page_summary['normalized_a_hrefs'])
         resolved_normalized_img_srcs = []
         if 'normalized_img_srcs' in web_page_summary:
-            resolved_normalized_img_srcs = self.url_resolver.resolve_list(web_page_summary['normalized_img_srcs'])
+            resolved_normalized_img_srcs = self.url_resolver.lookup_list(web_page_summary['normalized_img_srcs'])
 
         # add web_page_summary  resolved links
         # and add the additional url_id key value pair before writing to file
@@ -76,28 +97,46 @@ class URL_Indexer():
         written_web_page_summary['resolved_normalized_a_hrefs'] = resolved_normalized_a_hrefs
         written_web_page_summary['resolved_normalized_img_srcs'] = resolved_normalized_img_srcs
 
-        # write file
+        # write file, or append to the segment store
         logger.info("Saving response summary")
-        file_io.save('web_page_summary_file_path', written_web_page_summary,
-                     [output_directory_name, written_web_page_summary['url_id']])
+        if self.summary_store is not None:
+            self.summary_store.append(written_web_page_summary['url_id'], written_web_page_summary)
+        else:
+            file_io.save('web_page_summary_file_path', written_web_page_summary,
+                         [output_directory_name, written_web_page_summary['url_id']], defer=True)
 
 
-    def save_url_indexer(self):
+    def save_url_indexer(self, only_due=False):
+        """ Write full snapshots of both maps and empty their journals. With only_due, only of the maps
+            whose journal has outgrown their snapshot. """
         # write file
-        file_io.save('url_id_map_file', self.url_id_index.to_dict(), None)
-        file_io.save('resolved_url_map_file', self.url_resolver.to_dict(), None)
+        if not only_due or self.url_id_index.compaction_due():
+            self.url_id_index.compact(lambda table: file_io.save('url_id_map_file', table, None))
+        if not only_due or self.url_resolver.compaction_due():
+            self.url_resolver.compact(lambda table: file_io.save('resolved_url_map_file', table, None))
+
+    def flush_url_indexer(self):
+        """ Persist entries added since the last call, O(1) per entry. """
+        if self.summary_store is not None:
+            self.summary_store.flush()
+        self.url_id_index.flush_journal()
+        self.url_resolver.flush_journal()
+
+    def open_url_indexer_journals(self):
+        self.url_id_index.open_journal(file_io.get_path('url_id_map_journal_file', None, force=True))
+        self.url_resolver.open_journal(file_io.get_path('resolved_url_map_journal_file', None, force=True))
 
     def load_url_indexer(self):
 
-        # load url_id_index
+        # load url_id_index, snapshot then journal
         url_indexer_file_path = file_io.get_path('url_id_map_file', None)
-        if url_indexer_file_path is not None:
-            self.url_id_index.load(url_indexer_file_path)
+        url_indexer_journal_path = file_io.get_path('url_id_map_journal_file', None)
+        self.url_id_index.load(url_indexer_file_path, url_indexer_journal_path)
 
-        # load url_resolver
+        # load url_resolver, snapshot then journal
         url_resolver_file_path = file_io.get_path('resolved_url_map_file', None)
-        if url_resolver_file_path is not None:
-            self.url_resolver.load(url_resolver_file_path)
+        url_resolver_journal_path = file_io.get_path('resolved_url_map_journal_file', None)
+        self.url_resolver.load(url_resolver_file_path, url_resolver_journal_path)
 
     def __len__(self):
         return len(self.url_id_index)
@@ -107,6 +146,18 @@ class Document_Indexer():
 
     def __init__(self):
         self.hash_id_index = utils.Incremental_Hash_ID()
+        self.document_store = None
+        self.near_duplicate_index = None
+
+    def use_near_duplicate_index(self, threshold):
+        """ Skip saving documents at least threshold similar to a document already saved with a near duplicate index. """
+        self.near_duplicate_index = near_duplicates.SimHash_Index(threshold)
+
+        # snapshot then journal
+        simhash_file_path = file_io.get_path('doc_simhash_map_file', None)
+        simhash_journal_path = file_io.get_path('doc_simhash_map_journal_file', None)
+        self.near_duplicate_index.load(simhash_file_path, simhash_journal_path)
+        self.near_duplicate_index.open_journal(file_io.get_path('doc_simhash_map_journal_file', None, force=True))
 
     def document_in_index(self, content_hash):
         """ checks if document/content hash it is in index. returns boolean."""
@@ -116,27 +167,60 @@ class Document_Indexer():
         return False
 
     def save_term_frequency_dictionary(self, term_frequency_dictionary, content_hash, output_directory_name):
+        # a near duplicate of a saved document is not saved, its hash maps to that document's id,
+        # so pages with the same content later are found by document_in_index before they are tokenized
+        fingerprint = None
+        if self.near_duplicate_index is not None:
+            fingerprint = near_duplicates.simhash(term_frequency_dictionary['term_frequency_dict'])
+            near_duplicate_id = self.near_duplicate_index.find(fingerprint)
+            if near_duplicate_id is not None:
+                logger.info("Near Duplicate of Document ID: %d" % near_duplicate_id)
+                self.hash_id_index.add_alias(content_hash, near_duplicate_id)
+                return
+
         # add new document hash to index
         self.hash_id_index.add(content_hash)
         document_id = self.hash_id_index[content_hash]
+        if fingerprint is not None:
+            self.near_duplicate_index.add(document_id, fingerprint)
 
         # add doc id and hash to term frequency dictionary
         term_frequency_dictionary['document_id'] = document_id
         term_frequency_dictionary['content_hash'] = content_hash
 
         logger.info("Saving Document Term Frequency Dictonary ID: %d" % document_id)
+        # write file, or append to the segment store
+        if self.document_store is not None:
+            self.document_store.append(document_id, term_frequency_dictionary)
+        else:
+            file_io.save('document_frequency_dict_file_path', term_frequency_dictionary,
+                         [output_directory_name, document_id], defer=True)
+
+    def save_document_indexer(self, only_due=False):
+        """ Write a full snapshot of the map and empty its journal. With only_due, only of the maps whose
+            journal has outgrown their snapshot. """
         # write file
-        file_io.save('document_frequency_dict_file_path', term_frequency_dictionary,
-                     [output_directory_name, document_id])
-
-    def save_document_indexer(self):
-        # write file
-        file_io.save('doc_hash_id_map_file', self.hash_id_index.to_dict(), None)
+        if not only_due or self.hash_id_index.compaction_due():
+            self.hash_id_index.compact(lambda table: file_io.save('doc_hash_id_map_file', table, None))
+        if self.near_duplicate_index is not None and (not only_due or self.near_duplicate_index.compaction_due()):
+            self.near_duplicate_index.compact(lambda table: file_io.save('doc_simhash_map_file', table, None))
+
+    def flush_document_indexer(self):
+        """ Persist entries added since the last call, O(1) per entry. """
+        if self.document_store is not None:
+            self.document_store.flush()
+        self.hash_id_index.flush_journal()
+        if self.near_duplicate_index is not None:
+            self.near_duplicate_index.flush_journal()
+
+    def open_document_indexer_journal(self):
+        self.hash_id_index.open_journal(file_io.get_path('doc_hash_id_map_journal_file', None, force=True))
 
     def load_document_indexer(self):
+        # snapshot then journal
         document_indexer_file_path = file_io.get_path('doc_hash_id_map_file', None)
-        if document_indexer_file_path is not None:
-            self.hash_id_index.load(document_indexer_file_path)
+        document_indexer_journal_path = file_io.get_path('doc_hash_id_map_journal_file', None)
+        self.hash_id_index.load(document_indexer_file_path, document_indexer_journal_path)
 
 
 class Base_Station():
@@ -145,49 +229,242 @@ class Base_Station():
         self.url_indexer = URL_Indexer()
         self.document_indexer = Document_Indexer()
 
+        # guards the frontier and indexers when crawlers report from several threads
+        self.lock = threading.RLock()
+        self.in_flight_urls = set()
+        self.url_scorer = None
+        self.snapshot_interval = 100
+        self.pages_since_snapshot = 0
+        self.write_batch_size = 1
+        self.pages_since_flush = 0
+
+        # pipeline crawls, urls dispatched but not yet reported and documents reported but not yet saved
+        self.pipeline_condition = threading.Condition(self.lock)
+        self.pipeline_in_flight = 0
+        self.pending_content_hashes = set()
+
+        # recrawls, previous web page summary by url and urls added to the frontier during this crawl
+        self.recrawl = False
+        self.previous_summaries = {}
+        self.recrawl_scheduled_urls = set()
+        self.pages_dispatched = 0
+
+        # frontier and crawled urls, checkpointed so a stopped crawl can be resumed
+        self.crawl_state = None
+
+        # content hash of downloaded pages, and whether pages with indexed content are parsed for links
+        self.hash_algorithm = crawler.DEFAULT_HASH_ALGORITHM
+        self.parse_duplicates = False
+
         # load indexers
         self.load_indexes()
 
-    def update_frontier(self, url_list):
-        # filter
-        # resolve
-        filtered_urls = self.url_indexer.resolve_url_list(url_list)
-
-        # filter urls already in index
-        filtered_urls = self.url_indexer.filter_in_index(filtered_urls)
-
-        # filter links not within site bounds
-        filtered_urls = utils.filter_sub_directories(filtered_urls, [self.seed_url])
-
-        # filter robots
-        filtered_urls = utils.filter_sub_directories(filtered_urls, self.forbidden_urls, filter_if_sub=True)
-
-        # add to url frontier
-        self.url_frontier.add_list(filtered_urls)
-
-    def continue_indexing(self):
+    def update_frontier(self, url_list, parent_url=None):
+        """ Queue the links of the page at parent_url (the resolved url it was crawled as) that may be crawled. """
+        with self.lock:
+            # filter before resolving, so links that are out of bounds or forbidden as written cost no requests
+            # filter links not within site bounds
+            filtered_urls = utils.filter_sub_directories(url_list, self.site_bounds)
+
+            # filter robots
+            filtered_urls = utils.filter_sub_directories(filtered_urls, self.forbidden_urls, filter_if_sub=True)
+
+            # resolve
+            filtered_urls = self.url_indexer.resolve_url_list(filtered_urls)
+
+            # count inlinks and link depths for the priority frontier
+            if self.url_scorer is not None:
+                self.url_scorer.observe_links(set(filtered_urls))
+                changed_depths = self.url_scorer.observe_depths(parent_url, filtered_urls)
+                if self.crawl_state is not None:
+                    self.crawl_state.linked(set(filtered_urls))
+                    self.crawl_state.depths(changed_depths)
+
+            # filter urls already in index, or on a recrawl urls already queued or crawled this time
+            if self.recrawl:
+                filtered_urls = [url for url in filtered_urls if url not in self.recrawl_scheduled_urls]
+            else:
+                filtered_urls = self.url_indexer.filter_in_index(filtered_urls)
+
+            # filter urls currently being crawled
+            filtered_urls = [url for url in filtered_urls if url not in self.in_flight_urls]
+
+            # filter again, redirects can lead out of bounds
+            # filter links not within site bounds
+            filtered_urls = utils.filter_sub_directories(filtered_urls, [self.seed_url])
+
+            # filter robots
+            filtered_urls = utils.filter_sub_directories(filtered_urls, self.forbidden_urls, filter_if_sub=True)
+
+            # add to url frontier
+            if self.recrawl:
+                self.recrawl_scheduled_urls.update(filtered_urls)
+            if self.crawl_state is not None:
+                self.crawl_state.queued([url for url in dict.fromkeys(filtered_urls) if url not in self.url_frontier])
+            self.url_frontier.add_list(filtered_urls)
+
+    def restore_frontier(self):
+        """ Put the urls waiting when the crawl stopped back in the frontier, in the order they were queued,
+            and restore the counters that depend on the urls already crawled. """
+        with self.lock:
+            done_urls = self.crawl_state.done_urls
+            if self.url_scorer is not None:
+                self.url_scorer.observe_links(self.crawl_state.inlinks)
+                self.url_scorer.restore_depths(self.crawl_state.link_depths)
+                for url in done_urls:
+                    self.url_scorer.observe_dispatch(url)
+            self.pages_dispatched = len(done_urls)
+
+            for url in self.crawl_state.pending_urls():
+                self.url_frontier.add(url)
+                if self.recrawl:
+                    self.recrawl_scheduled_urls.add(url)
+            if self.recrawl:
+                self.recrawl_scheduled_urls.update(done_urls)
+
+            logger.info("Resuming crawl, %d urls crawled and %d urls waiting" % (len(done_urls), len(self.url_frontier)))
+
+    def continue_indexing(self, pending=0):
+        """ :param pending: number of urls removed from the frontier but not yet reported. """
 
         # stop if url queue is empty
         if len(self.url_frontier) == 0:
             return False
 
-        # stop if max_urls_to_index param has been reached
+        # stop if max_urls_to_index param has been reached, on a recrawl counting pages crawled this time
         if self.max_urls_to_index is not None:
-            return len(self.url_indexer) < self.max_urls_to_index
+            if self.recrawl:
+                return self.pages_dispatched < self.max_urls_to_index
+            return len(self.url_indexer) + pending < self.max_urls_to_index
 
         return True
 
-    def scrape_website(self, seed_url, output_directory, max_urls_to_index=None, stopwords_file=None):
+    def next_url(self):
+        """ Remove and return the next url to crawl from the frontier. """
+        with self.lock:
+            next_url = self.url_frontier.remove()
+            self.pages_dispatched += 1
+            if self.url_scorer is not None:
+                self.url_scorer.observe_dispatch(next_url)
+            return next_url
+
+    def duplicate_content(self, content_hash):
+        """ True if a page with this content was already reported as a new document, so a page with the same
+            content is not parsed or tokenized. Reads without the lock, safe to call from any thread. """
+        if self.parse_duplicates:
+            return False
+        return self.document_indexer.document_in_index(content_hash) or content_hash in self.pending_content_hashes
+
+    def page_done(self, url):
+        """ Record a crawled url once its summary and document have both been reported, a resumed crawl
+            crawls urls not done again. """
+        with self.lock:
+            if self.crawl_state is not None:
+                self.crawl_state.done(url)
+
+    def load_previous_summaries(self):
+        """ Keep the summary of every page of an earlier crawl into output_directory_name, by requested and resolved url. """
+        self.previous_summaries = {}
+        web_page_summaries = crawl_dataset.get_crawl_dataset(self.output_directory_name).web_page_summaries()
+        for wps in web_page_summaries:
+            previous_summary = {k: v for k, v in wps.items() if k in crawler.SUMMARY_ATTRIBUTES}
+            self.previous_summaries[wps['requested_url']] = previous_summary
+            if 'resolved_requested_url' in wps:
+                self.previous_summaries[wps['resolved_requested_url']] = previous_summary
+        logger.info("Recrawling %d previously indexed pages" % len(web_page_summaries))
+
+    def conditional_headers(self, url):
+        """ If-None-Match / If-Modified-Since headers for a page crawled before, None otherwise. Safe to call from any thread. """
+        previous_summary = self.previous_summaries.get(url)
+        if previous_summary is None:
+            return None
+
+        headers = {}
+        if 'etag' in previous_summary:
+            headers['If-None-Match'] = previous_summary['etag']
+        if 'last_modified' in previous_summary:
+            headers['If-Modified-Since'] = previous_summary['last_modified']
+        return headers or None
+
+    def scrape_website(self, seed_url, output_directory, max_urls_to_index=None, stopwords_file=None, parser_backend=None, workers=1,
+                       resolve_method=None, resolve_workers=None, frontier="fifo", scoring_criteria=("depth",),
+                       directory_budget=None, frontier_memory_limit=100000, snapshot_interval=100, write_batch_size=1,
+                       storage="files", tokenizer=None, parse_processes=0, parse_chunk_size=parse_pool.DEFAULT_CHUNK_SIZE,
+                       use_pipeline=False, extract_workers=2, tokenize_workers=2, queue_size=pipeline.DEFAULT_QUEUE_SIZE,
+                       recrawl=False, near_duplicate_threshold=None, hash_algorithm=crawler.DEFAULT_HASH_ALGORITHM,
+                       parse_duplicates=False, resume=False):
+        """ Crawl a website from seed_url. With resume, continue the crawl into output_directory that stopped,
+            the other parameters should be those it was started with (see crawl_state.Crawl_State.load_config).
+            stopwords_file is only kept with those parameters, documents are filtered with the nltk english stop words. """
+
+        # parameters saved for resume
+        config = {name: value for name, value in locals().items() if name not in ('self', 'resume')}
+
+        # content hashes of the earlier crawl are compared with new ones, crawls saved without an algorithm used md5
+        if recrawl:
+            previous_config = crawl_state.crawl_state(output_directory).load_config() or {}
+            previous_hash_algorithm = previous_config.get('hash_algorithm', "md5")
+            if previous_hash_algorithm != hash_algorithm:
+                raise ValueError("%s was crawled with content hash %s, it cannot be recrawled with %s"
+                                 % (output_directory, previous_hash_algorithm, hash_algorithm))
+
+        # segment records replace per file records of the same id when read, so files written after segments would be hidden
+        if storage == "files" and segment_store.has_segment_stores(output_directory):
+            raise ValueError("%s is stored in segments, continue it with storage segments" % output_directory)
+
+        self.url_indexer.url_resolver.configure(method=resolve_method, workers=resolve_workers)
+        if near_duplicate_threshold is not None:
+            self.document_indexer.use_near_duplicate_index(near_duplicate_threshold)
         self.seed_url = self.url_indexer.resolve_url(seed_url)
+
+        # links are in bounds if they fall under the seed url as given or as resolved
+        self.site_bounds = list(dict.fromkeys([seed_url, self.seed_url]))
         self.output_directory_name = output_directory
+        self.snapshot_interval = snapshot_interval
+        self.hash_algorithm = hash_algorithm
+        self.parse_duplicates = parse_duplicates
+        self.write_batch_size = write_batch_size
+        file_io.set_batch_size(write_batch_size)
+
+        # revisit indexed pages with conditional requests, before the segment stores are opened for writing
+        self.recrawl = recrawl
+        if recrawl:
+            self.load_previous_summaries()
+
+        # one file per summary and document, or packed segments
+        if storage == "segments":
+            self.url_indexer.summary_store = segment_store.web_page_summary_store(self.output_directory_name)
+            self.document_indexer.document_store = segment_store.document_store(self.output_directory_name)
         self.max_urls_to_index = max_urls_to_index
-        self.stopwords_file = stopwords_file
-
-        # read robots
-        self.forbidden_urls = self.url_indexer.resolve_url_list(robot_parser.read_robots_dissaloud(self.seed_url))
-
-        # make queue
-        self.url_frontier = utils.URL_Frontier()
+        self.parser_backend = parser_backend
+        self.tokenizer = tokenizer
+
+        # parse and tokenize in worker processes, or on the crawl threads
+        self.parse_pool = None
+        if parse_processes > 0:
+            self.parse_pool = parse_pool.Parse_Pool(parse_processes, parse_chunk_size, parser_backend, tokenizer)
+
+        # read robots, disallowed urls are built on the resolved seed url and never requested, not even to resolve them
+        self.forbidden_urls = robot_parser.read_robots_dissaloud(self.seed_url)
+
+        # make queue, first in first out (in memory or spilling to disk) or best first by url score
+        self.url_scorer = None
+        if frontier == "priority":
+            self.url_scorer = url_scoring.URL_Scorer(self.seed_url, scoring_criteria, directory_budget=directory_budget)
+            self.url_frontier = utils.Priority_URL_Frontier(self.url_scorer)
+        elif frontier == "disk":
+            spill_directory = file_io.get_path('frontier_directory_path', [self.output_directory_name], force=True)
+            self.url_frontier = utils.Spilling_URL_Frontier(spill_directory, memory_limit=frontier_memory_limit)
+        else:
+            self.url_frontier = utils.URL_Frontier()
+
+        # checkpointed crawl state, continued on resume and started over otherwise
+        self.crawl_state = crawl_state.crawl_state(self.output_directory_name)
+        if resume:
+            self.crawl_state.load()
+            self.restore_frontier()
+        else:
+            self.crawl_state.reset(config)
 
         # add seed to url frontier
         self.update_frontier([self.seed_url])
@@ -195,53 +472,282 @@ class Base_Station():
         # log
         self.write_log_file()
 
-        # create crawler
-        c = crawler.Crawler(self)
+        if use_pipeline:
+            self.crawl_pipeline(workers, extract_workers, tokenize_workers, queue_size)
 
-        # crawl size
-        while self.continue_indexing():
-            next_url = self.url_frontier.remove()
-            logger.info("Crawling: %s" % next_url)
-            logger.info("Number of sites in index: %d" % len(self.url_indexer))
-            c.crawl_web_page(next_url, self.stopwords_file)
+        elif workers > 1 or self.parse_pool is not None:
+            self.crawl_concurrently(workers)
+
+        else:
+            # create crawler
+            c = crawler.Crawler(self)
+
+            # crawl size
+            while self.continue_indexing():
+                next_url = self.next_url()
+                logger.info("Crawling: %s" % next_url)
+                logger.info("Number of sites in index: %d" % len(self.url_indexer))
+                c.crawl_web_page(next_url, self.parser_backend, self.tokenizer)
+                self.page_done(next_url)
+
+                # save maps periodically
+                self.checkpoint_indexes()
 
-            # save maps periodically
-            self.save_indexes()
+        if self.parse_pool is not None:
+            self.parse_pool.close()
 
         # save maps
         self.save_indexes()
+        self.crawl_state.close()
+
+    def crawl_concurrently(self, workers):
+        """ Fetch up to workers pages at once, each with its own crawler on a thread pool.
+            Pages are reported in the order they left the frontier, so url and document ids
+            are assigned exactly as they would be in a serial crawl. """
+
+        idle_crawlers = [crawler.Crawler(self) for _ in range(workers)]
+        in_flight = collections.deque()
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while True:
+
+                # keep every idle crawler busy
+                while len(idle_crawlers) > 0 and self.continue_indexing(pending=len(in_flight)):
+                    with self.lock:
+                        next_url = self.next_url()
+                        self.in_flight_urls.add(next_url)
+                    logger.info("Crawling: %s" % next_url)
+                    c = idle_crawlers.pop()
+                    if self.parse_pool is not None:
+                        fetched = executor.submit(c.fetch_web_page_to_pool, next_url, self.parse_pool)
+                    else:
+                        fetched = executor.submit(c.fetch_web_page, next_url, self.parser_backend)
+                    in_flight.append((c, next_url, fetched))
+
+                if len(in_flight) == 0:
+                    break
+
+                # report the oldest page, waiting for it if needed
+                c, url, fetched = in_flight.popleft()
+                if self.parse_pool is not None:
+                    web_page_summary, term_frequency_dict = fetched.result().result()
+                    c.index_web_page(web_page_summary, None, term_frequency_dict=term_frequency_dict)
+                else:
+                    web_page_summary, plain_text = fetched.result()
+                    c.index_web_page(web_page_summary, plain_text, self.tokenizer)
+                self.page_done(url)
+                logger.info("Number of sites in index: %d" % len(self.url_indexer))
+
+                with self.lock:
+                    self.in_flight_urls.discard(url)
+                idle_crawlers.append(c)
+
+                # save maps periodically
+                self.checkpoint_indexes()
+
+    def crawl_pipeline(self, fetch_workers, extract_workers, tokenize_workers, queue_size):
+        """ Crawl as pipeline stages connected by bounded queues: fetch -> extract -> dedup -> tokenize -> persist.
+            fetch, extract and tokenize run on their own thread pools. dedup and persist handle pages in the
+            order they left the frontier, so url and document ids are assigned exactly as in a serial crawl.
+            A full queue blocks the stage in front of it, and in the end the dispatch of new urls. """
+
+        stages = [
+            pipeline.Stage("fetch", self._fetch_stage, fetch_workers, queue_size=queue_size),
+            pipeline.Stage("extract", self._extract_stage, extract_workers, queue_size=queue_size),
+            pipeline.Stage("dedup", self._dedup_stage, ordered=True, queue_size=queue_size, handle_skipped=True),
+            pipeline.Stage("tokenize", self._tokenize_stage, tokenize_workers, queue_size=queue_size),
+            pipeline.Stage("persist", self._persist_stage, ordered=True, queue_size=queue_size, handle_skipped=True)
+        ]
+        stage_pipeline = pipeline.Pipeline(stages)
+        stage_pipeline.start()
+
+        sequence = 0
+        while True:
+            with self.pipeline_condition:
+                # with an empty frontier, wait for pages in flight to add links
+                while self.pipeline_in_flight > 0 and not self.continue_indexing(pending=self.pipeline_in_flight):
+                    self.pipeline_condition.wait()
+                if not self.continue_indexing(pending=self.pipeline_in_flight):
+                    break
+
+                next_url = self.next_url()
+                self.in_flight_urls.add(next_url)
+                self.pipeline_in_flight += 1
+
+            logger.info("Crawling: %s" % next_url)
+            stage_pipeline.put(pipeline.Job(sequence, next_url))
+            sequence += 1
+
+            if sequence % PIPELINE_STATUS_INTERVAL == 0:
+                logger.info("Pipeline queue depths: %s" % stage_pipeline.queue_depths())
+
+        stage_pipeline.close()
+        logger.info("Pipeline maximum queue depths: %s" % stage_pipeline.max_queue_depths())
+
+    def _fetch_stage(self, job):
+        job.page = crawler.fetch(job.url, self.conditional_headers(job.url), self.hash_algorithm)
+
+    def _extract_stage(self, job):
+        page, job.page = job.page, None
+        job.plain_text, job.term_frequency_dict = None, None
+
+        # content already indexed is not parsed
+        if page is not None and self.duplicate_content(page.content_hash):
+            job.web_page_summary = crawler.summarize_response(job.url, page, crawler.DUPLICATE_SUMMARY_ATTRIBUTES)
+        elif self.parse_pool is not None:
+            job.web_page_summary, job.term_frequency_dict = self.parse_pool.submit(job.url, page).result()
+        else:
+            job.web_page_summary = crawler.summarize_response(job.url, page, crawler.SUMMARY_ATTRIBUTES + ('plain_text',),
+                                                              parser_backend=self.parser_backend)
+            job.plain_text = job.web_page_summary.pop('plain_text', None)
+
+    def _dedup_stage(self, job):
+        """ Report the web page summary, and pass the page on only if its content is new and indexable. """
+        with self.pipeline_condition:
+            job.reported = False
+            try:
+                if job.skip:
+                    return
+
+                index_document = self.report_web_page_summary(job.web_page_summary)
+                job.reported = True
+                content_hash = job.web_page_summary.get('content_hash')
+
+                # a document with the same content may be reported but not yet saved
+                if not index_document or content_hash in self.pending_content_hashes:
+                    logger.info("Duplicate Document Found")
+                    job.skip = True
+                elif job.web_page_summary['content_type'] not in file_parser.acepted_content_types():
+                    job.skip = True
+                else:
+                    self.pending_content_hashes.add(content_hash)
+
+                logger.info("Number of sites in index: %d" % len(self.url_indexer))
+                self.checkpoint_indexes()
+
+            finally:
+                self.in_flight_urls.discard(job.url)
+                self.pipeline_in_flight -= 1
+                self.pipeline_condition.notify()
+
+    def _tokenize_stage(self, job):
+        if job.term_frequency_dict is None and job.plain_text is not None:
+            tokens = text_processing.plain_text_to_tokens(job.plain_text, tokenizer=self.tokenizer)
+            job.term_frequency_dict = text_processing.word_frequency_dict(tokens)
+        job.plain_text = None
+
+    def _persist_stage(self, job):
+        """ Save the document of a new page. Sees skipped pages too, to record every reported page as done. """
+        if not job.skip:
+            content_hash = job.web_page_summary['content_hash']
+            if job.term_frequency_dict is not None and len(job.term_frequency_dict) > 0:
+                logger.info("Sending Term Frequency Dictionary")
+                self.report_term_frequency_dictionary({'term_frequency_dict': job.term_frequency_dict}, content_hash)
+            with self.lock:
+                self.pending_content_hashes.discard(content_hash)
+
+        # pages that failed before they were reported are crawled again on resume
+        if job.reported:
+            self.page_done(job.url)
 
     def report_web_page_summary(self, web_page_summary):
         """ Recieves a web page summary dictonary from a crawler. Checks the content hash for content already indexed. Returns True if Not yet indexed"""
 
-        self.url_indexer.add_web_page_summary(web_page_summary, self.output_directory_name)
-
-        # update_frontier
-        if 'normalized_a_hrefs' in web_page_summary:
-            self.update_frontier(web_page_summary['normalized_a_hrefs'])
-
-        # checks if document has been indexed
-        if 'content_hash' in web_page_summary:
-            content_hash = web_page_summary['content_hash']
-            return not self.document_indexer.document_in_index(content_hash)  # continue indexing...
-        return False
+        with self.lock:
+            # on a recrawl, an unchanged page (not modified, or with the same content hash) keeps its summary and
+            # document with any new validators, a changed page's summary is replaced
+            unchanged, replace = False, False
+            if self.recrawl:
+                previous_summary = self.previous_summaries.get(web_page_summary['requested_url'])
+                if previous_summary is not None:
+                    content_hash = web_page_summary.get('content_hash')
+                    if web_page_summary['status_code'] == crawler.NOT_MODIFIED:
+                        logger.info("Page not modified: %s" % web_page_summary['requested_url'])
+                        web_page_summary, unchanged = previous_summary, True
+                    elif content_hash is not None and content_hash == previous_summary.get('content_hash'):
+                        logger.info("Page content unchanged: %s" % web_page_summary['requested_url'])
+                        validators = {k: web_page_summary[k] for k in ('etag', 'last_modified') if k in web_page_summary}
+                        web_page_summary, unchanged = dict(previous_summary, **validators), True
+
+            # pages with content already reported are reported without links, whether or not they were parsed
+            # before their content was, so the frontier does not depend on the order pages finish downloading
+            if not unchanged and self.duplicate_content(web_page_summary.get('content_hash')):
+                web_page_summary = {k: v for k, v in web_page_summary.items() if k in crawler.DUPLICATE_SUMMARY_ATTRIBUTES}
+
+            if self.recrawl:
+                replace = previous_summary is not None and web_page_summary != previous_summary
+
+            resolved_requested_url = self.url_indexer.index_url(web_page_summary['requested_url'], replace=replace)
+
+            # update_frontier, resolving only the links that may be crawled
+            if 'normalized_a_hrefs' in web_page_summary:
+                self.update_frontier(web_page_summary['normalized_a_hrefs'],
+                                     self.url_indexer.resolve_url(web_page_summary['requested_url']))
+
+            # write the summary of a url new to the index, with the links resolved above
+            if resolved_requested_url is not None:
+                self.url_indexer.save_web_page_summary(web_page_summary, resolved_requested_url, self.output_directory_name)
+
+            # checks if document has been indexed
+            if 'content_hash' in web_page_summary and not unchanged:
+                content_hash = web_page_summary['content_hash']
+                return not self.document_indexer.document_in_index(content_hash)  # continue indexing...
+            return False
 
     def report_term_frequency_dictionary(self, term_frequency_dictionary, content_hash):
         """ Recieves a web page summary dictonary from a crawler. Checks the content hash for contnet already indexed."""
-        self.document_indexer.save_term_frequency_dictionary(term_frequency_dictionary, content_hash,
-                                                             self.output_directory_name)
+        with self.lock:
+            self.document_indexer.save_term_frequency_dictionary(term_frequency_dictionary, content_hash,
+                                                                 self.output_directory_name)
 
-    def save_indexes(self):
+    def save_indexes(self, only_due=False):
+        """ Compact: write full snapshots of every map and the crawl state and empty the journals.
+            With only_due, only of those whose journal has outgrown their snapshot. """
         logger.info("Saving Index Files")
         # add log
-        self.document_indexer.save_document_indexer()
-        self.url_indexer.save_url_indexer()
+        with self.lock:
+            # deferred summaries and documents first, so snapshots never refer to unwritten files
+            file_io.flush()
+            self.document_indexer.flush_document_indexer()
+            self.url_indexer.flush_url_indexer()
+            if self.crawl_state is not None:
+                self.crawl_state.flush()
+            self.document_indexer.save_document_indexer(only_due)
+            self.url_indexer.save_url_indexer(only_due)
+            if self.crawl_state is not None and (not only_due or self.crawl_state.compaction_due()):
+                self.crawl_state.compact()
+            self.pages_since_snapshot = 0
+            self.pages_since_flush = 0
+
+    def checkpoint_indexes(self):
+        """ Called after every crawled page. Every write_batch_size pages writes the deferred summaries and
+            documents, then flushes new map entries to the journals, so journaled ids always have their files
+            and a crash loses at most the last batch. Every snapshot_interval pages compacts the journals that
+            have outgrown their snapshots. Snapshots then grow geometrically, and the cost of rewriting them
+            stays O(1) per page. """
+        with self.lock:
+            self.pages_since_flush += 1
+            if self.pages_since_flush >= self.write_batch_size:
+                file_io.flush()
+                self.document_indexer.flush_document_indexer()
+                self.url_indexer.flush_url_indexer()
+                if self.crawl_state is not None:
+                    self.crawl_state.flush()
+                self.pages_since_flush = 0
+
+            self.pages_since_snapshot += 1
+            if self.pages_since_snapshot >= self.snapshot_interval:
+                self.save_indexes(only_due=True)
 
     def load_indexes(self):
         logger.info("Loading Index Files")
         self.url_indexer.load_url_indexer()
         self.document_indexer.load_document_indexer()
 
+        # new entries are journaled from here on
+        self.url_indexer.open_url_indexer_journals()
+        self.document_indexer.open_document_indexer_journal()
+
     def write_log_file(self):
         self.log_info_dict = {}
         self.log_info_dict['seed_url'] = self.seed_url
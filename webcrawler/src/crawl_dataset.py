@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+
+__author__ = "L.J. Brown"
+__version__ = "1.0.1"
+
+import glob
+import json
+import logging
+import os
+import sys
+import threading
+
+# my lib
+from src import file_io
+from src import segment_store
+
+# logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.FileHandler("output/output_log.txt"))
+logger.addHandler(logging.StreamHandler(sys.stdout))
+
+"""
+    Crawl Dataset
+
+    In memory view of the collected data of a crawl (log file, web page summaries, document term frequency
+    dictionaries) shared by every summary report, so each file is read and parsed once rather than once per report.
+
+    Every access checks the files for changes: a file whose modification time or size changed is parsed again, new
+    files are added and deleted files dropped. Segment stores are reloaded whole when their offset index changes.
+    A crawl may hold both per file records and segments (continued with the other storage, or packed by
+    convert_directory), both are read and a segment record replaces the file of the same id.
+
+    Returned lists and dictionaries are shared, do not modify them.
+
+    use:
+        dataset = get_crawl_dataset("name")
+        web_page_summaries = dataset.web_page_summaries()
+"""
+
+
+def read_json(file_path):
+    with open(file_path, 'rb') as json_file:
+        return json.loads(json_file.read())
+
+
+def file_signature(file_path):
+    """ (modification time, size) of a file, None if it does not exist. """
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class Json_Files():
+    """ Parsed json files matching a glob pattern, refreshed on access. """
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+
+        # file path -> (signature, parsed json)
+        self.files = {}
+
+    def refresh(self):
+        """ Parse new and changed files, drop deleted ones. Returns True if anything changed. """
+        signatures = {file_path: file_signature(file_path) for file_path in glob.glob(self.pattern)}
+        signatures = {file_path: signature for file_path, signature in signatures.items() if signature is not None}
+
+        changed_paths = [file_path for file_path, signature in signatures.items()
+                         if file_path not in self.files or self.files[file_path][0] != signature]
+        deleted_paths = [file_path for file_path in self.files if file_path not in signatures]
+
+        for file_path in deleted_paths:
+            del self.files[file_path]
+
+        for file_path in changed_paths:
+            self.files[file_path] = (signatures[file_path], read_json(file_path))
+
+        return len(changed_paths) > 0 or len(deleted_paths) > 0
+
+    def values(self):
+        return [parsed for signature, parsed in self.files.values()]
+
+
+class Crawl_Dataset():
+
+    def __init__(self, indexed_directory_name):
+        """
+        :param indexed_directory_name: output directory of the crawl.
+        """
+        self.indexed_directory_name = indexed_directory_name
+        self.lock = threading.Lock()
+
+        self.summary_files = Json_Files(file_io.get_template('web_page_summary_file_path') % (indexed_directory_name, '*'))
+        self.document_files = Json_Files(file_io.get_template('document_frequency_dict_file_path') % (indexed_directory_name, '*'))
+
+        # bumped whenever the per file records change
+        self.summary_files_version = 0
+        self.document_files_version = 0
+
+        # cached views, with the signature of the files they were built from
+        self.cache = {}
+
+    def _cached(self, name, signature, build):
+        if name not in self.cache or self.cache[name][0] != signature:
+            self.cache[name] = (signature, build())
+        return self.cache[name][1]
+
+    def _store_signature(self, store_directory_type):
+        """ Signature of the offset index of a segment store, None if the crawl has no such store. """
+        if not segment_store.has_segment_store(self.indexed_directory_name, store_directory_type):
+            return None
+        store_directory = segment_store.store_directory(self.indexed_directory_name, store_directory_type)
+        return file_signature(os.path.join(store_directory, segment_store.OFFSETS_FILE_NAME))
+
+    def log_info(self):
+        with self.lock:
+            log_file_path = file_io.get_template('log_file') % self.indexed_directory_name
+            return self._cached('log_info', file_signature(log_file_path), lambda: read_json(log_file_path))
+
+    def web_page_summaries(self):
+        """ List of every web page summary of the crawl, from both per file records and segments. """
+        with self.lock:
+            if self.summary_files.refresh():
+                self.summary_files_version += 1
+            signature = (self.summary_files_version, self._store_signature('web_page_summaries_segment_directory_path'))
+            return self._cached('web_page_summaries', signature, self._load_summaries)
+
+    def document_frequency_dicts(self):
+        """ Dictionary of document id (as a string) -> term frequency dictionary, from both per file records and segments. """
+        with self.lock:
+            if self.document_files.refresh():
+                self.document_files_version += 1
+            signature = (self.document_files_version, self._store_signature('documents_segment_directory_path'))
+            return self._cached('document_frequency_dicts', signature, self._load_documents)
+
+    def _load_summaries(self):
+        # a record packed into segments replaces the file of the same url id (convert_directory leaves the files in place)
+        web_page_summaries = {wps['url_id']: wps for wps in self.summary_files.values()}
+        if segment_store.has_segment_store(self.indexed_directory_name, 'web_page_summaries_segment_directory_path'):
+            web_page_summaries.update((wps['url_id'], wps) for wps in self._load_summary_store())
+        return list(web_page_summaries.values())
+
+    def _load_documents(self):
+        documents = {str(dfd['document_id']): dfd['term_frequency_dict'] for dfd in self.document_files.values()}
+        if segment_store.has_segment_store(self.indexed_directory_name, 'documents_segment_directory_path'):
+            documents.update(self._load_document_store())
+        return documents
+
+    def _load_summary_store(self):
+        store = segment_store.web_page_summary_store(self.indexed_directory_name)
+        web_page_summaries = list(store)
+        store.close()
+        return web_page_summaries
+
+    def _load_document_store(self):
+        store = segment_store.document_store(self.indexed_directory_name)
+        documents = {str(dfd['document_id']): dfd['term_frequency_dict'] for dfd in store}
+        store.close()
+        return documents
+
+
+_datasets = {}
+_datasets_lock = threading.Lock()
+
+
+def get_crawl_dataset(indexed_directory_name):
+    """ Return the shared dataset of a crawl, created on first use. """
+    with _datasets_lock:
+        if indexed_directory_name not in _datasets:
+            _datasets[indexed_directory_name] = Crawl_Dataset(indexed_directory_name)
+        return _datasets[indexed_directory_name]
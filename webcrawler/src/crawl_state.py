@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+
+__author__ = "L.J. Brown"
+__version__ = "1.0.1"
+
+import collections
+import json
+import logging
+import os
+import sys
+
+# my lib
+from src import file_io
+from src import utils
+
+# logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.FileHandler("output/output_log.txt"))
+logger.addHandler(logging.StreamHandler(sys.stdout))
+
+"""
+    Crawl State
+
+    What a stopped crawl needs to continue where it stopped: its configuration, the urls still waiting in its
+    frontier and which urls were crawled. The url and document id maps are checkpointed on their own.
+
+        state_directory/
+            config.json         scrape_website parameters of the crawl, written when it starts
+            frontier.txt        urls waiting at the last snapshot, one per line in frontier order
+            state.json          urls crawled, inlink counts and link depths at the last snapshot
+            journal.jsonl       records since the snapshot: ["queued", [urls]], ["linked", [urls]],
+                                ["depths", {url: depth}], ["done", url]
+
+    Every url added to the frontier and every crawled url is appended to the journal. A url is done once its page
+    is reported, so pages in flight when the crawl stopped are queued again. compact() rewrites the snapshot from
+    the previous one and the journal, streaming frontier.txt, then empties the journal. Replaying a journal twice
+    leaves the same frontier, so a crash between the two steps is harmless. compaction_due() once the journal holds
+    more urls than utils.COMPACTION_FRACTION of the snapshot, so rewriting snapshots costs O(1) per journaled url.
+
+    use:
+        state = Crawl_State("collected_data/name/crawl_state/")
+        state.reset(config)
+        state.queued(urls)
+        state.done(url)
+        state.flush()
+
+        state = Crawl_State("collected_data/name/crawl_state/")
+        state.load()
+        frontier.add_list(state.pending_urls())
+"""
+
+CONFIG_FILE_NAME = "config.json"
+FRONTIER_FILE_NAME = "frontier.txt"
+STATE_FILE_NAME = "state.json"
+JOURNAL_FILE_NAME = "journal.jsonl"
+
+# scrape_website parameters that were removed, ignored in the configs of earlier crawls
+REMOVED_PARAMETERS = ("seen_filter_capacity", "seen_filter_error_rate")
+
+
+class Crawl_State():
+
+    def __init__(self, state_directory):
+        """ :param state_directory: directory of the state files, created if needed. """
+        self.state_directory = state_directory
+        if not os.path.exists(state_directory):
+            os.makedirs(state_directory)
+
+        self.done_urls = set()
+        self.inlinks = collections.Counter()
+        self.link_depths = {}
+        self.journal = None
+
+        # urls in the journal and in the snapshot
+        self.journal_entries = 0
+        self.snapshot_entries = 0
+
+    def _path(self, file_name):
+        return os.path.join(self.state_directory, file_name)
+
+    def _write_json(self, file_name, data):
+        temporary_file_path = self._path(file_name) + '.tmp'
+        with open(temporary_file_path, 'w') as file:
+            file.write(json.dumps(data))
+        os.replace(temporary_file_path, self._path(file_name))
+
+    def load_config(self):
+        """ scrape_website parameters of the crawl, None if it never started. """
+        if not os.path.isfile(self._path(CONFIG_FILE_NAME)):
+            return None
+        with open(self._path(CONFIG_FILE_NAME)) as config_file:
+            config = json.load(config_file)
+        return {name: value for name, value in config.items() if name not in REMOVED_PARAMETERS}
+
+    def reset(self, config):
+        """ Start the state of a new crawl, discarding the state of any earlier crawl. """
+        for file_name in (FRONTIER_FILE_NAME, STATE_FILE_NAME):
+            if os.path.isfile(self._path(file_name)):
+                os.remove(self._path(file_name))
+        self.done_urls = set()
+        self.inlinks = collections.Counter()
+        self.link_depths = {}
+        self.journal_entries = 0
+        self.snapshot_entries = 0
+
+        self.open_journal()
+        self.journal.truncate()
+        self._write_json(CONFIG_FILE_NAME, config)
+
+    def load(self):
+        """ Load the snapshot, then replay the journal written since it. """
+        if os.path.isfile(self._path(STATE_FILE_NAME)):
+            with open(self._path(STATE_FILE_NAME)) as state_file:
+                state = json.load(state_file)
+            self.done_urls = set(state['done'])
+            self.inlinks = collections.Counter(state['inlinks'])
+            self.link_depths = state.get('depths', {})
+        self.snapshot_entries = len(self.done_urls) + len(self.inlinks) + len(self.link_depths) + \
+                                sum(1 for _ in self._snapshot_frontier_urls())
+
+        self.journal_entries = 0
+        for record_type, value in utils.Journal.replay(self._path(JOURNAL_FILE_NAME)):
+            if record_type == "done":
+                self.done_urls.add(value)
+                self.journal_entries += 1
+            else:
+                if record_type == "linked":
+                    self.inlinks.update(value)
+                elif record_type == "depths":
+                    self.link_depths.update(value)
+                self.journal_entries += len(value)
+
+        self.open_journal()
+
+    def _snapshot_frontier_urls(self):
+        if os.path.isfile(self._path(FRONTIER_FILE_NAME)):
+            with open(self._path(FRONTIER_FILE_NAME), encoding='utf-8') as frontier_file:
+                for line in frontier_file:
+                    yield line.rstrip('\n')
+
+    def _queued_urls(self):
+        """ Yields every url queued since the crawl started, in order, possibly repeated. """
+        for url in self._snapshot_frontier_urls():
+            yield url
+
+        for record_type, value in utils.Journal.replay(self._path(JOURNAL_FILE_NAME)):
+            if record_type == "queued":
+                for url in value:
+                    yield url
+
+    def pending_urls(self):
+        """ Yields the urls queued but not done, in the order they were queued. """
+        for url in self._queued_urls():
+            if url not in self.done_urls:
+                yield url
+
+    def open_journal(self):
+        if self.journal is None:
+            self.journal = utils.Journal(self._path(JOURNAL_FILE_NAME))
+
+    def queued(self, urls):
+        """ Record urls added to the frontier. """
+        if len(urls) > 0:
+            self.journal.append("queued", urls)
+            self.journal_entries += len(urls)
+
+    def linked(self, urls):
+        """ Record the links of a page, counted by the "inlinks" url scoring criteria. """
+        self.inlinks.update(urls)
+        self.journal.append("linked", list(urls))
+        self.journal_entries += len(urls)
+
+    def depths(self, link_depths):
+        """ Record link depths lowered (or first set) by the "depth" url scoring criteria. """
+        if len(link_depths) > 0:
+            self.link_depths.update(link_depths)
+            self.journal.append("depths", link_depths)
+            self.journal_entries += len(link_depths)
+
+    def done(self, url):
+        """ Record a url whose page has been reported. """
+        self.done_urls.add(url)
+        self.journal.append("done", url)
+        self.journal_entries += 1
+
+    def flush(self):
+        self.journal.flush()
+
+    def compaction_due(self):
+        """ True once the journal has outgrown utils.COMPACTION_FRACTION of the snapshot. """
+        return utils.compaction_due(self.journal_entries, self.snapshot_entries)
+
+    def compact(self):
+        """ Write a snapshot of the pending urls, done urls, inlink counts and link depths, then empty the journal. """
+        self.journal.flush()
+
+        pending_url_count = 0
+        temporary_frontier_path = self._path(FRONTIER_FILE_NAME) + '.tmp'
+        with open(temporary_frontier_path, 'w', encoding='utf-8') as frontier_file:
+            for url in self.pending_urls():
+                frontier_file.write(url + '\n')
+                pending_url_count += 1
+        os.replace(temporary_frontier_path, self._path(FRONTIER_FILE_NAME))
+
+        self._write_json(STATE_FILE_NAME, {'done': list(self.done_urls), 'inlinks': self.inlinks, 'depths': self.link_depths})
+        self.journal.truncate()
+        self.journal_entries = 0
+        self.snapshot_entries = pending_url_count + len(self.done_urls) + len(self.inlinks) + len(self.link_depths)
+
+    def close(self):
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+
+
+def crawl_state(indexed_directory_name):
+    return Crawl_State(file_io.get_path('crawl_state_directory_path', [indexed_directory_name], force=True))
@@ -3,14 +3,19 @@
 __author__ = "L.J. Brown"
 __version__ = "1.0.1"
 
+import collections
 import hashlib
-import requests
+from concurrent.futures import Future
 from urllib.parse import urljoin
 import logging
 
+# external
+from requests.compat import chardet
+
 # my lib
 from src import file_parser
 from src import text_processing
+from src import http_client
 
 
 # logging
@@ -18,6 +23,33 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+# attributes of a web page summary reported to the base station
+SUMMARY_ATTRIBUTES = ("requested_url", "redirect_history", "status_code", "content_type","content_hash", "normalized_a_hrefs", 'normalized_img_srcs',
+                      "etag", "last_modified")
+
+# attributes of the web page summary of a page whose content is already indexed, reported without parsing the page
+DUPLICATE_SUMMARY_ATTRIBUTES = tuple(a for a in SUMMARY_ATTRIBUTES if a not in ('normalized_a_hrefs', 'normalized_img_srcs'))
+
+# status code of a conditional request for a page that has not changed
+NOT_MODIFIED = 304
+
+# content hash of the raw response body, computed as it is downloaded.
+# md5 as in earlier crawls, a crawl recrawled with another algorithm would see every page as new content
+DEFAULT_HASH_ALGORITHM = "md5"
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+
+def hash_algorithms():
+    return ["blake2b", "md5", "sha1", "sha256"]
+
+
+def new_content_hasher(hash_algorithm=DEFAULT_HASH_ALGORITHM):
+    """ hashlib object for content hashes, blake2b is given a 128 bit digest like md5. """
+    if hash_algorithm == "blake2b":
+        return hashlib.blake2b(digest_size=16)
+    return hashlib.new(hash_algorithm)
+
+
 def normalize_urls(base_url, raw_links):
     """ takes in list of raw links both relative and absolute and returns list of absolute links. """
     raw_links = [l for l in raw_links if l is not None]
@@ -25,32 +57,86 @@ def normalize_urls(base_url, raw_links):
     return list(absolute_links)
 
 
-def pull_summary(requested_url, included_attributes=("requested_url", "redirect_history", "status_code", "content_type","content_hash", "normalized_a_hrefs", 'normalized_img_srcs'), stopwords_file=None):
-    """ access a given url and return a python dictionary of page data. """
+def fetch(requested_url, headers=None, hash_algorithm=DEFAULT_HASH_ALGORITHM):
+    """ make a single request for a given url. returns a Fetched_Page, or None if the request failed.
+        The body is hashed chunk by chunk as it is downloaded.
+        headers may hold If-None-Match / If-Modified-Since, the response is then NOT_MODIFIED if the page has not changed. """
+    try:
+        response = http_client.get(requested_url, headers=headers, stream=True)
+
+        # log status code
+        logger.info("Response Status Code: %d" % response.status_code)
+
+        hasher = new_content_hasher(hash_algorithm)
+        chunks = []
+        for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+            hasher.update(chunk)
+            chunks.append(chunk)
+        return Fetched_Page(response, b''.join(chunks), hasher.hexdigest())
+
+    except:
+        logger.warning("Requested Page: %s, Failed to read." % requested_url)
+        return None
+
+
+# a redirect in the history of a Fetched_Page
+Redirect = collections.namedtuple('Redirect', ['url'])
+
+
+class Fetched_Page():
+    """ The parts of a response that summarize_response reads, small and picklable so a page can be sent to a
+        parse process. The raw body bytes are sent, text is decoded on the receiving side. """
+
+    def __init__(self, response, content=None, content_hash=None):
+        """ :param content, content_hash: body of a streamed response and its hash, response.content and its
+            hash with DEFAULT_HASH_ALGORITHM if not given. """
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.history = [Redirect(redirect.url) for redirect in response.history]
+        self.content = content if content is not None else response.content
+        self.encoding = response.encoding
+        self.content_hash = content_hash
+        if content_hash is None:
+            hasher = new_content_hasher()
+            hasher.update(self.content)
+            self.content_hash = hasher.hexdigest()
+        self.decoded_text = None
+
+    @property
+    def text(self):
+        """ Body decoded the way requests decodes response.text, once. """
+        if self.decoded_text is None:
+            encoding = self.encoding
+            if encoding is None and chardet is not None:
+                encoding = chardet.detect(self.content)['encoding']
+            try:
+                self.decoded_text = str(self.content, encoding or 'utf-8', errors='replace')
+            except (LookupError, TypeError):
+                self.decoded_text = str(self.content, errors='replace')
+        return self.decoded_text
+
+
+def summarize_response(requested_url, response, included_attributes=SUMMARY_ATTRIBUTES, stopwords_file=None, parser_backend=None,
+                       tokenizer=None):
+    """ build a python dictionary of page data from an already fetched page (a Fetched_Page). """
 
     response_summary = {
         'requested_url': requested_url,
         'status_code' : 404
     }
 
-    # set 'requested_url' value
-
     try:
 
-        # make request
-        response = requests.get(requested_url)
+        if response is not None:
 
-        # set "status_code" value
-        response_summary['status_code'] = response.status_code
-
-        # log status code
-        logger.info("Response Status Code: %d" % response.status_code)
+            # set "status_code" value
+            response_summary['status_code'] = response.status_code
 
         # continue if status is 200
-        if response.status_code == 200:
+        if response is not None and response.status_code == 200:
 
-            # set 'content_hash' value
-            response_summary['content_hash'] = str(hashlib.md5(str.encode(response.text)).hexdigest())
+            # set 'content_hash' value, hashed from the raw body as it was downloaded
+            response_summary['content_hash'] = response.content_hash
             
             # set 'redirect_history'  value
             response_summary['redirect_history'] = []
@@ -61,39 +147,58 @@ def pull_summary(requested_url, included_attributes=("requested_url", "redirect_
             if 'content-type' in response.headers:
                 response_summary['content_type'] = response.headers['content-type']
 
+            # set 'etag' and 'last_modified' values, sent back on a recrawl to ask if the page changed
+            if 'etag' in response.headers:
+                response_summary['etag'] = response.headers['etag']
+            if 'last-modified' in response.headers:
+                response_summary['last_modified'] = response.headers['last-modified']
+
             # set 'binary_response_content' value
             if 'binary_response_content' in included_attributes:
                 response_summary['binary_response_content'] = response.content
 
+            # html is parsed at most once, for plain text and links together
+            content_type = response_summary.get('content_type', '')
+            html_attributes = {'plain_text', 'tokens', 'term_frequency_dict', 'normalized_a_hrefs', 'normalized_img_srcs'}
+            extracted_html = None
+            if content_type[:9] == "text/html" and (html_attributes & set(included_attributes)):
+                extracted_html = file_parser.extract_html(response.text, parser_backend)
+
+            # plain text and tokens are computed at most once and shared by the attributes below
+            plain_text, tokens = None, None
+            if {'plain_text', 'tokens', 'term_frequency_dict'} & set(included_attributes):
+                if content_type.split(';')[0] in file_parser.acepted_content_types():
+                    if extracted_html is not None:
+                        plain_text = extracted_html['plain_text']
+                    else:
+                        plain_text = file_parser.extract_plain_text(response.text, content_type)
+                    if plain_text is not None and ({'tokens', 'term_frequency_dict'} & set(included_attributes)):
+                        tokens = text_processing.plain_text_to_tokens(plain_text, stopwords_file, tokenizer)
+
             # set 'plain_text' value
             if 'plain_text' in included_attributes:
                 response_summary['plain_text'] = None
-                if response_summary['content_type'] in file_parser.acepted_content_types():
-                    response_summary['plain_text'] = file_parser.extract_plain_text(response.text, response_summary['content_type'])
+                if content_type in file_parser.acepted_content_types():
+                    response_summary['plain_text'] = plain_text
 
             # set 'tokens' value
-            if 'tokens' in included_attributes:
-                if response_summary['content_type'].split(';')[0] in file_parser.acepted_content_types():
-                    plain_text = file_parser.extract_plain_text(response.text, response_summary['content_type'])
-                    response_summary['tokens'] = text_processing.plain_text_to_tokens(plain_text)
+            if 'tokens' in included_attributes and tokens is not None:
+                response_summary['tokens'] = tokens
 
-            if 'term_frequency_dict' in included_attributes:
-               if response_summary['content_type'].split(';')[0] in file_parser.acepted_content_types():
-                   plain_text = file_parser.extract_plain_text(response.text, response_summary['content_type'])
-                   tokens = text_processing.plain_text_to_tokens(plain_text, stopwords_file)
-                   response_summary['term_frequency_dict'] = text_processing.word_frequency_dict(tokens)
+            # set 'term_frequency_dict' value
+            if 'term_frequency_dict' in included_attributes and tokens is not None:
+                response_summary['term_frequency_dict'] = text_processing.word_frequency_dict(tokens)
 
             # if type "text/html" - read links
-            if ('normalized_a_hrefs' in included_attributes) or ('normalized_img_srcs' in included_attributes):
-                if response.headers['content-type'][:9] == "text/html":
+            if extracted_html is not None:
 
-                    # Note: base_url is requested_url
+                # Note: base_url is requested_url
 
-                    # set 'normalized_a_hrefs'
-                    response_summary['normalized_a_hrefs'] = normalize_urls(requested_url, file_parser.extract_a_hrefs_list(response.text))
+                # set 'normalized_a_hrefs'
+                response_summary['normalized_a_hrefs'] = normalize_urls(requested_url, extracted_html['a_hrefs'])
 
-                    # set 'normalized_img_srcs'
-                    response_summary['normalized_img_srcs'] = normalize_urls(requested_url, file_parser.extract_img_srcs_list(response.text))
+                # set 'normalized_img_srcs'
+                response_summary['normalized_img_srcs'] = normalize_urls(requested_url, extracted_html['img_srcs'])
 
     except:
         logger.warning("Requested Page: %s, Failed to read." % response_summary['requested_url'])
@@ -104,16 +209,61 @@ def pull_summary(requested_url, included_attributes=("requested_url", "redirect_
     return response_summary
 
 
+def pull_summary(requested_url, included_attributes=SUMMARY_ATTRIBUTES, stopwords_file=None, parser_backend=None, tokenizer=None):
+    """ access a given url and return a python dictionary of page data. """
+    response = fetch(requested_url)
+    return summarize_response(requested_url, response, included_attributes, stopwords_file, parser_backend, tokenizer)
+
+
 class Crawler():
 
     def __init__(self, base_station):
         self.base_station = base_station
 
     # crawler_id
-    def crawl_web_page(self, requested_url, stopwords_file=None):
+    def crawl_web_page(self, requested_url, parser_backend=None, tokenizer=None):
+        web_page_summary, plain_text = self.fetch_web_page(requested_url, parser_backend)
+        self.index_web_page(web_page_summary, plain_text, tokenizer)
+
+    def fetch(self, requested_url):
+        """ Request a web page with the base station's conditional headers and content hash algorithm. """
+        return fetch(requested_url, self.base_station.conditional_headers(requested_url), self.base_station.hash_algorithm)
+
+    def fetch_web_page(self, requested_url, parser_backend=None):
+        """ Request and parse a web page. Only reads from the base station, safe to run on a worker thread.
+            returns the web page summary and the plain text extracted with it. """
+
+        # make a single request, every step below works from this one response
+        page = self.fetch(requested_url)
+
+        # content already indexed is not parsed
+        if page is not None and self.base_station.duplicate_content(page.content_hash):
+            return summarize_response(requested_url, page, DUPLICATE_SUMMARY_ATTRIBUTES), None
+
+        # retrieve web page summary, plain text is extracted from the same parse as the links
+        web_page_summary = summarize_response(requested_url, page, SUMMARY_ATTRIBUTES + ('plain_text',),
+                                              parser_backend=parser_backend)
+        plain_text = web_page_summary.pop('plain_text', None)
+
+        return web_page_summary, plain_text
+
+    def fetch_web_page_to_pool(self, requested_url, parse_pool):
+        """ Request a web page and queue it on a parse_pool.Parse_Pool. Only reads from the base station.
+            returns a handle whose result() is the web page summary and term frequency dictionary. """
+        page = self.fetch(requested_url)
+
+        # content already indexed is summarized here without parsing
+        if page is not None and self.base_station.duplicate_content(page.content_hash):
+            parsed = Future()
+            parsed.set_result((summarize_response(requested_url, page, DUPLICATE_SUMMARY_ATTRIBUTES), None))
+            return parsed
+
+        return parse_pool.submit(requested_url, page)
 
-        # retrieve web page summary
-        web_page_summary = pull_summary(requested_url, stopwords_file=stopwords_file)
+    def index_web_page(self, web_page_summary, plain_text, tokenizer=None, term_frequency_dict=None):
+        """ Report a fetched web page to the base station and send its term frequency dictionary if it is new.
+            term_frequency_dict may be given when it was already built by the parse stage, plain_text is then not needed.
+            Document terms are filtered with the nltk english stop words. """
 
         # report to base station
         index_document = self.base_station.report_web_page_summary(web_page_summary)
@@ -126,13 +276,15 @@ class Crawler():
         # create document term frequency dictionary
         if web_page_summary['content_type'] in file_parser.acepted_content_types():
             logger.info("Creating Term Frequency Dictionary")
-            tfdict = pull_summary(requested_url, ('term_frequency_dict'))
 
-            if tfdict is not None:
-                if 'term_frequency_dict' in tfdict:
-                    if (len(tfdict['term_frequency_dict']) > 0):
-                        logger.info("Sending Term Frequency Dictionary")
-                        # report to base station
-                        self.base_station.report_term_frequency_dictionary(tfdict, web_page_summary['content_hash'])
+            if term_frequency_dict is None and plain_text is not None:
+                tokens = text_processing.plain_text_to_tokens(plain_text, tokenizer=tokenizer)
+                term_frequency_dict = text_processing.word_frequency_dict(tokens)
 
+            if term_frequency_dict is not None:
+                tfdict = {'term_frequency_dict': term_frequency_dict}
 
+                if (len(tfdict['term_frequency_dict']) > 0):
+                    logger.info("Sending Term Frequency Dictionary")
+                    # report to base station
+                    self.base_station.report_term_frequency_dictionary(tfdict, web_page_summary['content_hash'])
@@ -2,6 +2,7 @@ import json
 import os
 import logging
 import sys
+import threading
 
 # logging
 logging.basicConfig(level=logging.INFO)
@@ -26,38 +27,119 @@ def load_directory_structure():
     return directory_structure_dict
 
 
-def save(type, data, parameters_list):
-    directory_structure_dict = load_directory_structure()
-    file_path = directory_structure_dict['path_templates'][type]
-    if parameters_list is not None:
-        file_path = file_path % tuple(parameters_list)
-    directory_path = os.path.split(file_path)[0]
+class Storage():
+    """
+        Reads and writes collected data at the paths in config/directory_structure.json.
 
-    # if directory does not exist, create it
-    if not os.path.exists(directory_path):
-        os.makedirs(directory_path)
+        The config is read once and every path template is precompiled into its file path and directory
+        templates. Directories are only checked for or created the first time they are written to.
+        Writes passed with defer=True are buffered and written batch_size at a time, or on flush().
+    """
 
-    # write response summary file
-    with open(file_path, 'w') as file:
-        file.write(json.dumps(data))
+    def __init__(self, batch_size=1):
+        self.directory_structure_dict = load_directory_structure()
 
+        # type -> (file path template, directory path template, number of parameters in the directory template)
+        self.compiled_templates = {}
+        for type, template in self.directory_structure_dict['path_templates'].items():
+            directory_template = os.path.split(template)[0]
+            self.compiled_templates[type] = (template, directory_template, directory_template.count('%s'))
 
-def get_path(type, parameters_list, force=False):
-    directory_structure_dict = load_directory_structure()
-    file_path = directory_structure_dict['path_templates'][type]
-    if parameters_list is not None:
-        file_path = file_path % tuple(parameters_list)
+        self.created_directories = set()
+        self.batch_size = batch_size
+        self.pending_writes = {}
+        self.lock = threading.Lock()
+
+    def _paths(self, type, parameters_list):
+        template, directory_template, directory_parameters = self.compiled_templates[type]
+        if parameters_list is None:
+            return template, directory_template
+        parameters = tuple(parameters_list)
+        return template % parameters, directory_template % parameters[:directory_parameters]
+
+    def _write(self, file_path, directory_path, data):
+        # if directory does not exist, create it
+        if directory_path not in self.created_directories:
+            if directory_path != '' and not os.path.exists(directory_path):
+                os.makedirs(directory_path)
+            self.created_directories.add(directory_path)
+
+        # write file, through a temporary file so a crash never leaves a partly written file
+        temporary_file_path = file_path + '.tmp'
+        with open(temporary_file_path, 'w') as file:
+            file.write(json.dumps(data))
+        os.replace(temporary_file_path, file_path)
+
+    def save(self, type, data, parameters_list, defer=False):
+        file_path, directory_path = self._paths(type, parameters_list)
+
+        if not defer or self.batch_size <= 1:
+            self._write(file_path, directory_path, data)
+            return
+
+        with self.lock:
+            # a later write to the same path replaces the pending one
+            self.pending_writes[file_path] = (directory_path, data)
+            if len(self.pending_writes) >= self.batch_size:
+                self._flush()
+
+    def _flush(self):
+        for file_path, (directory_path, data) in self.pending_writes.items():
+            self._write(file_path, directory_path, data)
+        self.pending_writes = {}
+
+    def flush(self):
+        """ Write every deferred write. """
+        with self.lock:
+            self._flush()
+
+    def get_path(self, type, parameters_list, force=False):
+        file_path = self._paths(type, parameters_list)[0]
+
+        # check if file exists
+        if file_path not in self.pending_writes and not os.path.isfile(file_path) and not os.path.isdir(file_path):
+            logger.warning("file does not exit")
+            if force:
+                return file_path
+            return None
+
+        return file_path
 
-    # check if file exists
-    if not os.path.isfile(file_path) and not os.path.isdir(file_path):
-        logger.warning("file does not exit")
-        if force:
-            return file_path
-        return None
+    def get_template(self, type):
+        return self.compiled_templates[type][0]
 
-    return file_path
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage():
+    """ Return the shared Storage, created on first use. """
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            _storage = Storage()
+    return _storage
+
+
+def set_batch_size(batch_size):
+    """ Number of deferred writes buffered before they are written together. 1 writes through. """
+    storage = get_storage()
+    storage.flush()
+    storage.batch_size = batch_size
+
+
+def save(type, data, parameters_list, defer=False):
+    get_storage().save(type, data, parameters_list, defer)
+
+
+def flush():
+    get_storage().flush()
+
+
+def get_path(type, parameters_list, force=False):
+    return get_storage().get_path(type, parameters_list, force)
 
 
 def get_template(type):
-    directory_structure_dict = load_directory_structure()
-    return directory_structure_dict['path_templates'][type]
\ No newline at end of file
+    return get_storage().get_template(type)
@@ -1,7 +1,10 @@
+import functools
 import logging
+from html.parser import HTMLParser
 
 # external
 from bs4 import BeautifulSoup
+from bs4 import FeatureNotFound
 
 # logging
 logging.basicConfig(level=logging.INFO)
@@ -11,6 +14,24 @@ logger = logging.getLogger(__name__)
 def acepted_content_types():
     return ["text/html", "text/plain"]
 
+
+def parser_backends():
+    return ["html.parser", "lxml", "stream"]
+
+
+DEFAULT_PARSER_BACKEND = "html.parser"
+
+
+@functools.lru_cache(maxsize=None)
+def backend_installed(backend):
+    """ Return True if BeautifulSoup can build a tree with backend, warns once (per process) if it cannot """
+    try:
+        BeautifulSoup("", backend)
+    except FeatureNotFound:
+        logger.warning("parser backend %s is not installed (pip install %s), using html.parser" % (backend, backend))
+        return False
+    return True
+
 #
 #   Extract Plain Text from response.text and response.headers['content-type']
 #
@@ -25,25 +46,100 @@ def extract_plain_text(response_text, content_type):
         return None
 
 def extract_plain_text_html(response_text):
-    soup = BeautifulSoup(response_text, 'html.parser')
-    return soup.get_text()
+    return extract_html(response_text)['plain_text']
 
 def extract_plain_text_txt(response_text):
     return response_text
 
 
+#
+#   Extract plain text, <a href="EXTRACT"> and <img src="EXTRACT"> together from a single parse of response.text
+#
+
+def extract_html(html_string, backend=None):
+    """
+    :param html_string: response.text, assuming response.headers['content-type'] == 'text/html'
+    :param backend: one of parser_backends(). "html.parser" and "lxml" build a BeautifulSoup tree,
+                    "stream" uses an HTMLParser subclass that never builds a tree. Defaults to DEFAULT_PARSER_BACKEND.
+    :return: dictionary with 'plain_text', 'a_hrefs' and 'img_srcs' values.
+    """
+    if backend is None:
+        backend = DEFAULT_PARSER_BACKEND
+
+    if backend == "stream":
+        parser = Streaming_HTML_Extractor()
+        parser.feed(html_string)
+        parser.close()
+        return parser.to_dict()
+
+    if backend not in parser_backends():
+        logger.error("unknown parser backend: %s, using html.parser" % backend)
+        backend = "html.parser"
+
+    if not backend_installed(backend):
+        backend = "html.parser"
+
+    soup = BeautifulSoup(html_string, backend)
+
+    return {
+        'plain_text': soup.get_text(),
+        'a_hrefs': [l.get('href') for l in soup.find_all('a')],
+        'img_srcs': [l.get('src') for l in soup.find_all('img', src=True)]
+    }
+
+
+class Streaming_HTML_Extractor(HTMLParser):
+    """ Collects plain text, a hrefs and img srcs as the document is read, without building a tree. """
+
+    # text inside these tags is not part of the plain text (matches BeautifulSoup.get_text)
+    ignored_text_tags = ('script', 'style', 'template')
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.text_parts = []
+        self.a_hrefs = []
+        self.img_srcs = []
+        self.ignored_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'a':
+            self.a_hrefs.append(dict(attrs).get('href'))
+        elif tag == 'img':
+            attrs = dict(attrs)
+            if attrs.get('src') is not None:
+                self.img_srcs.append(attrs['src'])
+        elif tag in self.ignored_text_tags:
+            self.ignored_depth += 1
+
+    def handle_startendtag(self, tag, attrs):
+        # self closing tags have no text to ignore
+        if tag not in self.ignored_text_tags:
+            self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        if tag in self.ignored_text_tags and self.ignored_depth > 0:
+            self.ignored_depth -= 1
+
+    def handle_data(self, data):
+        if self.ignored_depth == 0:
+            self.text_parts.append(data)
+
+    def to_dict(self):
+        return {
+            'plain_text': ''.join(self.text_parts),
+            'a_hrefs': self.a_hrefs,
+            'img_srcs': self.img_srcs
+        }
+
+
 #
 #   Extract all <a href="EXTRACT"> from response.text  assuming response.headers['content-type'] == 'text/html'
 #
 
 # content type must be text/html
 def extract_a_hrefs_list(html_string):
-    soup = BeautifulSoup(html_string, 'html.parser')
-    a_hrefs = [l.get('href') for l in soup.find_all('a')]
-    return a_hrefs
+    return extract_html(html_string)['a_hrefs']
 
 # content type must be text/html
 def extract_img_srcs_list(html_string):
-    soup = BeautifulSoup(html_string, 'html.parser')
-    img_srcs = [l.get('src') for l in soup.find_all('img', src=True)]
-    return img_srcs
+    return extract_html(html_string)['img_srcs']
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+
+__author__ = "L.J. Brown"
+__version__ = "1.0.1"
+
+import logging
+import sys
+import threading
+
+# external
+import requests
+from requests.adapters import HTTPAdapter
+
+# logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.FileHandler("output/output_log.txt"))
+logger.addHandler(logging.StreamHandler(sys.stdout))
+
+"""
+    Shared HTTP Client
+
+    Every network call (crawler, webpage accessor, url resolver, robots.txt) goes through one
+    requests.Session so connections are kept alive and reused instead of reopened per request.
+
+    use:
+        http_client.configure(pool_maxsize=16, user_agent="my-crawler")   # optional, once at start up
+        response = http_client.get(url)
+"""
+
+DEFAULT_USER_AGENT = "webcrawler/%s (+https://github.com/browlm13/info_retrieval_webcrawler)" % __version__
+DEFAULT_POOL_CONNECTIONS = 10     # number of hosts to keep a connection pool for
+DEFAULT_POOL_MAXSIZE = 10         # number of keep alive connections per host
+
+
+class HTTP_Client():
+    """ A requests.Session with a keep alive connection pool per host, a user agent and default headers. """
+
+    def __init__(self, pool_connections=DEFAULT_POOL_CONNECTIONS, pool_maxsize=DEFAULT_POOL_MAXSIZE,
+                 user_agent=DEFAULT_USER_AGENT, headers=None, timeout=None, max_retries=0):
+        """
+        :param pool_connections: number of per host connection pools to cache.
+        :param pool_maxsize: maximum number of connections kept alive for a single host. Should be at least the number of crawl workers.
+        :param user_agent: User-Agent header sent with every request.
+        :param headers: dictionary of additional default headers.
+        :param timeout: default timeout in seconds for every request, None waits forever.
+        :param max_retries: number of retries on connection errors.
+        """
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=max_retries)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.session.headers['User-Agent'] = user_agent
+        if headers is not None:
+            self.session.headers.update(headers)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def head(self, url, **kwargs):
+        kwargs.setdefault('allow_redirects', True)
+        return self.request('HEAD', url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def configure(**kwargs):
+    """ Replace the shared client. Accepts the HTTP_Client keyword arguments. """
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = HTTP_Client(**kwargs)
+    return _client
+
+
+def get_client():
+    """ Return the shared client, creating one with default settings on first use. """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HTTP_Client()
+    return _client
+
+
+def get(url, **kwargs):
+    return get_client().get(url, **kwargs)
+
+
+def head(url, **kwargs):
+    return get_client().head(url, **kwargs)
@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+
+__author__ = "L.J. Brown"
+__version__ = "1.0.1"
+
+import array
+import json
+import logging
+import mmap
+import os
+import shutil
+import sys
+
+# my lib
+from src import file_io
+
+# logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.FileHandler("output/output_log.txt"))
+logger.addHandler(logging.StreamHandler(sys.stdout))
+
+"""
+    Inverted Index
+
+    Term -> postings index over the document term frequency dictionaries of a crawl.
+
+        index_directory/
+            index.json                  current generation, number of documents and terms
+            generation_1/
+                terms.txt               sorted terms, one per line
+                lexicon.bin             per term, in terms.txt order: document frequency, postings offset,
+                                        postings length, last document id (4 unsigned 64 bit integers)
+                postings.bin            per term: (document id delta, term frequency) pairs as varints,
+                                        document ids ascending, the first delta is from 0
+                document_lengths.bin    total term frequency of each document, indexed by document id, 0 if not indexed
+
+    Postings are read through mmap. Adding documents writes a new generation and switches index.json over to it,
+    an interrupted merge leaves the previous generation in use. Document ids are assigned in increasing order, so
+    the postings of new documents are appended to the old encoded bytes without decoding them.
+
+    use:
+        merge_documents("collected_data/name/inverted_index/", {document_id: term_frequency_dict, ...})
+        index = Inverted_Index("collected_data/name/inverted_index/")
+        document_ids, term_frequencies = index.postings("crawl")
+"""
+
+MANIFEST_FILE_NAME = "index.json"
+GENERATION_DIRECTORY_NAME = "generation_%d"
+TERMS_FILE_NAME = "terms.txt"
+LEXICON_FILE_NAME = "lexicon.bin"
+POSTINGS_FILE_NAME = "postings.bin"
+DOCUMENT_LENGTHS_FILE_NAME = "document_lengths.bin"
+
+# lexicon fields, LEXICON_FIELDS unsigned 64 bit integers per term
+DOCUMENT_FREQUENCY, POSTINGS_OFFSET, POSTINGS_LENGTH, LAST_DOCUMENT_ID = range(4)
+LEXICON_FIELDS = 4
+
+
+#
+#   Variable length integers, 7 bits per byte, high bit set on every byte but the last
+#
+
+def encode_varint(number, buffer):
+    """ Append number to the bytearray buffer. """
+    while number > 0x7f:
+        buffer.append((number & 0x7f) | 0x80)
+        number >>= 7
+    buffer.append(number)
+
+
+def encode_postings(document_ids, term_frequencies, previous_document_id=0, buffer=None):
+    """ Encode ascending document ids as deltas from previous_document_id, each followed by its term frequency. """
+    if buffer is None:
+        buffer = bytearray()
+    for document_id, term_frequency in zip(document_ids, term_frequencies):
+        encode_varint(document_id - previous_document_id, buffer)
+        encode_varint(term_frequency, buffer)
+        previous_document_id = document_id
+    return buffer
+
+
+def decode_postings(data):
+    """ Decode encoded postings bytes into (array of document ids, array of term frequencies). """
+    document_ids, term_frequencies = array.array('Q'), array.array('Q')
+    document_id, number, shift, is_delta = 0, 0, 0, True
+    for byte in data:
+        number |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+
+        if is_delta:
+            document_id += number
+            document_ids.append(document_id)
+        else:
+            term_frequencies.append(number)
+        number, shift, is_delta = 0, 0, not is_delta
+    return document_ids, term_frequencies
+
+
+class Inverted_Index():
+
+    def __init__(self, index_directory):
+        """ :param index_directory: directory of an index written by merge_documents. An empty index is opened if there is none. """
+        self.index_directory = index_directory
+        self.manifest = read_manifest(index_directory)
+        self.generation_directory = None
+        self.postings_file, self.postings_map = None, None
+
+        self.terms = []
+        self.term_positions = {}
+        self.lexicon = array.array('Q')
+        self.document_lengths = array.array('Q')
+
+        if self.manifest['generation'] > 0:
+            self.generation_directory = os.path.join(index_directory, GENERATION_DIRECTORY_NAME % self.manifest['generation'])
+            self._load()
+
+    def _load(self):
+        with open(os.path.join(self.generation_directory, TERMS_FILE_NAME), encoding='utf-8') as terms_file:
+            self.terms = terms_file.read().split('\n') if self.manifest['term_count'] > 0 else []
+        self.term_positions = {term: position for position, term in enumerate(self.terms)}
+
+        with open(os.path.join(self.generation_directory, LEXICON_FILE_NAME), 'rb') as lexicon_file:
+            self.lexicon.frombytes(lexicon_file.read())
+        with open(os.path.join(self.generation_directory, DOCUMENT_LENGTHS_FILE_NAME), 'rb') as lengths_file:
+            self.document_lengths.frombytes(lengths_file.read())
+
+        # mmap of an empty file is not allowed
+        postings_path = os.path.join(self.generation_directory, POSTINGS_FILE_NAME)
+        if os.path.getsize(postings_path) > 0:
+            self.postings_file = open(postings_path, 'rb')
+            self.postings_map = mmap.mmap(self.postings_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __contains__(self, term):
+        return term in self.term_positions
+
+    def __len__(self):
+        """ Number of terms. """
+        return len(self.terms)
+
+    @property
+    def document_count(self):
+        return self.manifest['document_count']
+
+    def lexicon_entry(self, term):
+        """ Returns (document frequency, postings offset, postings length, last document id), or None for an unknown term. """
+        position = self.term_positions.get(term)
+        if position is None:
+            return None
+        start = position * LEXICON_FIELDS
+        return tuple(self.lexicon[start:start + LEXICON_FIELDS])
+
+    def document_frequency(self, term):
+        entry = self.lexicon_entry(term)
+        return entry[DOCUMENT_FREQUENCY] if entry is not None else 0
+
+    def encoded_postings(self, term):
+        """ Encoded postings bytes of term, empty for an unknown term. """
+        entry = self.lexicon_entry(term)
+        if entry is None or entry[POSTINGS_LENGTH] == 0:
+            return b''
+        offset = entry[POSTINGS_OFFSET]
+        return self.postings_map[offset:offset + entry[POSTINGS_LENGTH]]
+
+    def postings(self, term):
+        """ Returns (array of ascending document ids, array of term frequencies) of the documents containing term. """
+        return decode_postings(self.encoded_postings(term))
+
+    def document_length(self, document_id):
+        """ Total term frequency of a document, 0 if it is not in the index. """
+        if document_id >= len(self.document_lengths):
+            return 0
+        return self.document_lengths[document_id]
+
+    def document_ids(self):
+        return [document_id for document_id, length in enumerate(self.document_lengths) if length > 0]
+
+    def close(self):
+        if self.postings_map is not None:
+            self.postings_map.close()
+            self.postings_file.close()
+            self.postings_map, self.postings_file = None, None
+
+
+def read_manifest(index_directory):
+    manifest_path = os.path.join(index_directory, MANIFEST_FILE_NAME)
+    if not os.path.isfile(manifest_path):
+        return {'generation': 0, 'document_count': 0, 'term_count': 0}
+    with open(manifest_path) as manifest_file:
+        return json.load(manifest_file)
+
+
+def merge_documents(index_directory, documents):
+    """ Add documents, a dictionary of integer document id -> term frequency dictionary, to the index in index_directory.
+        Documents already in the index are skipped. Returns the number of documents added. """
+
+    index = Inverted_Index(index_directory)
+    documents = {document_id: tf_dict for document_id, tf_dict in documents.items()
+                 if index.document_length(document_id) == 0 and len(tf_dict) > 0}
+    if len(documents) == 0:
+        index.close()
+        return 0
+
+    # invert the new documents, term -> (ascending document ids, term frequencies)
+    new_postings = {}
+    for document_id in sorted(documents):
+        for term, term_frequency in documents[document_id].items():
+            if term not in new_postings:
+                new_postings[term] = (array.array('Q'), array.array('Q'))
+            new_postings[term][0].append(document_id)
+            new_postings[term][1].append(term_frequency)
+
+    generation = index.manifest['generation'] + 1
+    generation_directory = os.path.join(index_directory, GENERATION_DIRECTORY_NAME % generation)
+    if os.path.exists(generation_directory):
+        shutil.rmtree(generation_directory)
+    os.makedirs(generation_directory)
+
+    # merge the sorted old and new term lists, writing postings as they are merged
+    terms = sorted(set(index.terms) | set(new_postings))
+    lexicon = array.array('Q')
+    with open(os.path.join(generation_directory, POSTINGS_FILE_NAME), 'wb') as postings_file:
+        offset = 0
+        for term in terms:
+            old_entry = index.lexicon_entry(term)
+            buffer = bytearray(index.encoded_postings(term))
+            document_frequency, last_document_id = 0, 0
+            if old_entry is not None:
+                document_frequency, last_document_id = old_entry[DOCUMENT_FREQUENCY], old_entry[LAST_DOCUMENT_ID]
+
+            if term in new_postings:
+                document_ids, term_frequencies = new_postings[term]
+
+                # new document ids follow the old ones, append to the encoded bytes
+                if document_ids[0] > last_document_id or document_frequency == 0:
+                    encode_postings(document_ids, term_frequencies, last_document_id, buffer)
+
+                # otherwise decode, merge and encode again
+                else:
+                    old_document_ids, old_term_frequencies = decode_postings(buffer)
+                    merged = sorted(list(zip(old_document_ids, old_term_frequencies)) + list(zip(document_ids, term_frequencies)))
+                    buffer = encode_postings([m[0] for m in merged], [m[1] for m in merged])
+
+                document_frequency += len(document_ids)
+                last_document_id = max(last_document_id, document_ids[-1])
+
+            postings_file.write(buffer)
+            lexicon.extend((document_frequency, offset, len(buffer), last_document_id))
+            offset += len(buffer)
+
+    with open(os.path.join(generation_directory, TERMS_FILE_NAME), 'w', encoding='utf-8') as terms_file:
+        terms_file.write('\n'.join(terms))
+    with open(os.path.join(generation_directory, LEXICON_FILE_NAME), 'wb') as lexicon_file:
+        lexicon.tofile(lexicon_file)
+
+    document_lengths = array.array('Q', index.document_lengths)
+    for document_id, tf_dict in documents.items():
+        if document_id >= len(document_lengths):
+            document_lengths.extend([0] * (document_id + 1 - len(document_lengths)))
+        document_lengths[document_id] = sum(tf_dict.values())
+    with open(os.path.join(generation_directory, DOCUMENT_LENGTHS_FILE_NAME), 'wb') as lengths_file:
+        document_lengths.tofile(lengths_file)
+
+    # switch over to the new generation, then remove the old one
+    manifest = {'generation': generation, 'document_count': index.document_count + len(documents), 'term_count': len(terms)}
+    manifest_path = os.path.join(index_directory, MANIFEST_FILE_NAME)
+    with open(manifest_path + '.tmp', 'w') as manifest_file:
+        json.dump(manifest, manifest_file)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+    old_generation_directory = index.generation_directory
+    index.close()
+    if old_generation_directory is not None:
+        shutil.rmtree(old_generation_directory, ignore_errors=True)
+
+    return len(documents)
+
+
+#
+#   Index of a crawl
+#
+
+def index_directory(indexed_directory_name):
+    return file_io.get_path('inverted_index_directory_path', [indexed_directory_name], force=True)
+
+
+def open_index(indexed_directory_name):
+    return Inverted_Index(index_directory(indexed_directory_name))
+
+
+def build_index(indexed_directory_name, document_frequency_dicts):
+    """ Merge the documents of a crawl not yet in its index into the index.
+        :param document_frequency_dicts: dictionary of document id -> term frequency dictionary, as from summary.load_document_frequency_dicts. """
+    documents = {int(document_id): tf_dict for document_id, tf_dict in document_frequency_dicts.items()}
+    added = merge_documents(index_directory(indexed_directory_name), documents)
+    logger.info("Added %d documents to the inverted index of %s" % (added, indexed_directory_name))
+    return added
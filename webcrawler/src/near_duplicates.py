@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+__author__ = "L.J. Brown"
+__version__ = "1.0.1"
+
+import functools
+import hashlib
+import logging
+import sys
+import threading
+
+# external
+import numpy as np
+
+# my lib
+from src import utils
+
+# logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.FileHandler("output/output_log.txt"))
+logger.addHandler(logging.StreamHandler(sys.stdout))
+
+"""
+    Near Duplicates
+
+    SimHash fingerprints of documents, and an index finding an indexed document whose fingerprint is close to a
+    new one. Pages that differ only in a timestamp, session id or navigation bar have nearly the same terms, and
+    so fingerprints that differ in a few bits.
+
+    The fingerprint of a term frequency dictionary has bit i set if the term frequencies of the terms with bit i
+    set in their own hash outweigh those without it. The similarity of two fingerprints is the fraction of equal bits.
+
+    Banded lookup: for a similarity threshold allowing at most k different bits, the fingerprint is cut into k + 1
+    bands. Two fingerprints within k bits agree on at least one whole band, so only documents sharing a band with
+    the new fingerprint are compared instead of every indexed document.
+
+    use:
+        near_duplicate_index = SimHash_Index(threshold=0.95)
+        fingerprint = simhash(term_frequency_dict)
+        document_id = near_duplicate_index.find(fingerprint)       ->  None if no near duplicate
+        near_duplicate_index.add(new_document_id, fingerprint)
+"""
+
+FINGERPRINT_BITS = 64
+DEFAULT_THRESHOLD = 0.95
+TERM_HASH_CACHE_SIZE = 100000
+
+
+@functools.lru_cache(maxsize=TERM_HASH_CACHE_SIZE)
+def term_hash(term):
+    """ Stable 64 bit hash of a term, the same in every process and run. """
+    return int.from_bytes(hashlib.blake2b(term.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def simhash(term_frequency_dict):
+    """ 64 bit SimHash fingerprint of a term frequency dictionary, weighted by term frequency. """
+    if len(term_frequency_dict) == 0:
+        return 0
+
+    hashes = np.fromiter((term_hash(term) for term in term_frequency_dict), dtype=np.uint64, count=len(term_frequency_dict))
+    weights = np.fromiter(term_frequency_dict.values(), dtype=np.float64, count=len(term_frequency_dict))
+
+    # one row of bits per term, least significant bit first
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1, bitorder='little')
+    votes = weights @ (2.0 * bits - 1.0)
+    return int(np.packbits(votes > 0, bitorder='little').view('<u8')[0])
+
+
+def hamming_distance(fingerprint_a, fingerprint_b):
+    return bin(fingerprint_a ^ fingerprint_b).count('1')
+
+
+def max_distance(threshold):
+    """ Largest number of different bits of fingerprints at least threshold similar. """
+    return int(FINGERPRINT_BITS * (1 - threshold) + 1e-9)
+
+
+class SimHash_Index(utils.Journaled_Map):
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD):
+        """ :param threshold: similarity, from 0 to 1, at which a document is a near duplicate of another. """
+        if not 0 < threshold <= 1:
+            raise ValueError("near duplicate threshold must be in (0, 1]: %s" % threshold)
+
+        self.threshold = threshold
+        self.max_distance = max_distance(threshold)
+
+        # band bit ranges, k + 1 bands of nearly equal width
+        number_of_bands = min(self.max_distance + 1, FINGERPRINT_BITS)
+        edges = [FINGERPRINT_BITS * i // number_of_bands for i in range(number_of_bands + 1)]
+        self.bands = [(start, (1 << (end - start)) - 1) for start, end in zip(edges, edges[1:])]
+
+        # document id -> fingerprint, and per band: band value -> document ids
+        self.fingerprints = {}
+        self.band_tables = [{} for _ in self.bands]
+        self.lock = threading.Lock()
+        self.journal = None
+
+    def _band_values(self, fingerprint):
+        return [(fingerprint >> start) & mask for start, mask in self.bands]
+
+    def _index(self, document_id, fingerprint):
+        self.fingerprints[document_id] = fingerprint
+        for band_table, band_value in zip(self.band_tables, self._band_values(fingerprint)):
+            band_table.setdefault(band_value, []).append(document_id)
+
+    def add(self, document_id, fingerprint):
+        self._index(document_id, fingerprint)
+        self.journal_entry(document_id, fingerprint)
+
+    def find(self, fingerprint):
+        """ Returns the id of the closest indexed document at least threshold similar, lowest id on ties, or None. """
+        best = None
+        for band_table, band_value in zip(self.band_tables, self._band_values(fingerprint)):
+            for document_id in band_table.get(band_value, ()):
+                distance = hamming_distance(fingerprint, self.fingerprints[document_id])
+                if distance <= self.max_distance and (best is None or (distance, document_id) < best):
+                    best = (distance, document_id)
+        return best[1] if best is not None else None
+
+    def similarity(self, fingerprint_a, fingerprint_b):
+        return 1 - hamming_distance(fingerprint_a, fingerprint_b) / FINGERPRINT_BITS
+
+    def __len__(self):
+        return len(self.fingerprints)
+
+    def to_dict(self):
+        return self.fingerprints
+
+    def snapshot(self):
+        return self.fingerprints
+
+    def restore(self, document_id, fingerprint):
+        self._index(int(document_id), fingerprint)
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+
+__author__ = "L.J. Brown"
+__version__ = "1.0.1"
+
+import logging
+import multiprocessing
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# my lib
+from src import crawler
+from src import text_processing
+
+# logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.FileHandler("output/output_log.txt"))
+logger.addHandler(logging.StreamHandler(sys.stdout))
+
+"""
+    Parse Pool
+
+    Html parsing, tokenizing and stemming are pure python and hold the GIL, so crawl threads can only
+    fetch concurrently. A Parse_Pool moves that work to worker processes: fetch threads submit the raw
+    response bytes and headers of a page, a process returns the web page summary (links, content hash)
+    and the term frequency dictionary. Plain text never leaves the worker process.
+
+    Pages are sent in chunks. A page is submitted right away while a process is idle, and otherwise held
+    until chunk_size pages are waiting or its result is asked for, so busy pools pay the transfer cost once
+    per chunk instead of once per page.
+
+    use:
+        parse_pool = Parse_Pool(processes=4)
+        handle = parse_pool.submit(requested_url, crawler.fetch(requested_url))
+        web_page_summary, term_frequency_dict = handle.result()
+"""
+
+DEFAULT_CHUNK_SIZE = 8
+
+
+def parse_pages(pages, parser_backend=None, tokenizer=None):
+    """ Runs in a worker process. Summarize a chunk of (requested_url, Fetched_Page) pairs,
+        returns a list of (web_page_summary, term_frequency_dict). """
+    results = []
+    for requested_url, page in pages:
+        web_page_summary = crawler.summarize_response(requested_url, page, crawler.SUMMARY_ATTRIBUTES + ('plain_text',),
+                                                      parser_backend=parser_backend)
+        plain_text = web_page_summary.pop('plain_text', None)
+
+        term_frequency_dict = None
+        if plain_text is not None:
+            tokens = text_processing.plain_text_to_tokens(plain_text, tokenizer=tokenizer)
+            term_frequency_dict = text_processing.word_frequency_dict(tokens)
+
+        results.append((web_page_summary, term_frequency_dict))
+    return results
+
+
+class Parsed_Page():
+    """ Handle for a page submitted to a Parse_Pool. """
+
+    def __init__(self, parse_pool):
+        self.parse_pool = parse_pool
+        self.chunk = None
+        self.position = None
+
+    def result(self):
+        """ Wait for and return (web_page_summary, term_frequency_dict). """
+        if self.chunk is None:
+            self.parse_pool.flush()
+        return self.chunk.result()[self.position]
+
+
+class Parse_Pool():
+
+    def __init__(self, processes, chunk_size=DEFAULT_CHUNK_SIZE, parser_backend=None, tokenizer=None):
+        """
+        :param processes: number of worker processes.
+        :param chunk_size: maximum number of pages sent to a process at once.
+        :param parser_backend, tokenizer: passed on to crawler.summarize_response and text_processing.
+        """
+        self.processes = processes
+        self.chunk_size = chunk_size
+        self.options = (parser_backend, tokenizer)
+
+        # worker processes are spawned, forking a process with running crawl threads is unsafe
+        self.executor = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"))
+        self.lock = threading.RLock()     # a chunk finishing before its callback is added calls back under the lock
+
+        # pages waiting to be sent, and number of chunks sent but not finished
+        self.waiting_pages = []
+        self.waiting_handles = []
+        self.running_chunks = 0
+
+    def submit(self, requested_url, page):
+        """ Queue a crawler.Fetched_Page (or None for a failed request) for parsing. Returns a Parsed_Page handle. """
+        handle = Parsed_Page(self)
+        with self.lock:
+            self.waiting_pages.append((requested_url, page))
+            self.waiting_handles.append(handle)
+            if len(self.waiting_pages) >= self.chunk_size or self.running_chunks < self.processes:
+                self._send_chunk()
+        return handle
+
+    def flush(self):
+        """ Send every waiting page. """
+        with self.lock:
+            if len(self.waiting_pages) > 0:
+                self._send_chunk()
+
+    def _send_chunk(self):
+        chunk = self.executor.submit(parse_pages, self.waiting_pages, *self.options)
+        for position, handle in enumerate(self.waiting_handles):
+            handle.position = position
+            handle.chunk = chunk
+
+        self.waiting_pages = []
+        self.waiting_handles = []
+        self.running_chunks += 1
+        chunk.add_done_callback(self._chunk_done)
+
+    def _chunk_done(self, chunk):
+        with self.lock:
+            self.running_chunks -= 1
+
+    def close(self):
+        self.flush()
+        self.executor.shutdown(wait=True)
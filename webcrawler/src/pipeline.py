@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+
+__author__ = "L.J. Brown"
+__version__ = "1.0.1"
+
+import logging
+import queue
+import sys
+import threading
+
+# logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.FileHandler("output/output_log.txt"))
+logger.addHandler(logging.StreamHandler(sys.stdout))
+
+"""
+    Pipeline
+
+    Stages connected by bounded queues. Each stage has its own worker threads, takes jobs from its input
+    queue and puts them on the next stage's queue. A full queue blocks the stage before it, so a slow
+    stage throttles every stage upstream instead of letting jobs pile up in memory.
+
+    Jobs carry a consecutive sequence number. An ordered stage has a single worker and handles jobs in
+    sequence order, holding early arrivals until the jobs before them come through. Jobs are never dropped
+    between stages, a stage marks a job it has nothing more to do with as skipped and passes it on.
+
+    use:
+        p = Pipeline([Stage("fetch", fetch, workers=8), Stage("parse", parse, workers=2), Stage("store", store, ordered=True)])
+        p.start()
+        p.put(Job(0, url))
+        p.queue_depths()    ->  {"fetch": 3, "parse": 0, "store": 1}
+        p.close()
+"""
+
+DEFAULT_QUEUE_SIZE = 16
+
+# queue end marker
+STOP = None
+
+
+class Job():
+    """ A unit of work passed through the stages. Stage functions add attributes as they go. """
+
+    def __init__(self, sequence, url):
+        self.sequence = sequence
+        self.url = url
+        self.skip = False
+
+
+class Stage():
+
+    def __init__(self, name, function, workers=1, ordered=False, queue_size=DEFAULT_QUEUE_SIZE, handle_skipped=False):
+        """
+        :param name: stage name used in queue_depths().
+        :param function: called with each job that is not skipped, on one of the worker threads.
+        :param workers: number of worker threads, an ordered stage always has one.
+        :param ordered: handle jobs in sequence order.
+        :param queue_size: maximum number of jobs waiting for the stage.
+        :param handle_skipped: call function with skipped jobs too, for stages that must see every job.
+        """
+        self.name = name
+        self.function = function
+        self.ordered = ordered
+        self.handle_skipped = handle_skipped
+        self.workers = 1 if ordered else workers
+        self.input_queue = queue.Queue(maxsize=queue_size)
+        self.next_stage = None
+        self.threads = []
+        self.max_depth = 0
+
+        # ordered stages, jobs that arrived before their turn
+        self.next_sequence = 0
+        self.waiting_jobs = {}
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name="%s-%d" % (self.name, i), daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def put(self, job):
+        """ Blocks while the stage's queue is full. """
+        self.input_queue.put(job)
+        self.max_depth = max(self.max_depth, self.input_queue.qsize())
+
+    def depth(self):
+        return self.input_queue.qsize() + len(self.waiting_jobs)
+
+    def _run(self):
+        while True:
+            job = self.input_queue.get()
+            if job is STOP:
+                return
+
+            if not self.ordered:
+                self._handle(job)
+                continue
+
+            self.waiting_jobs[job.sequence] = job
+            while self.next_sequence in self.waiting_jobs:
+                self._handle(self.waiting_jobs.pop(self.next_sequence))
+                self.next_sequence += 1
+
+    def _handle(self, job):
+        if not job.skip or self.handle_skipped:
+            try:
+                self.function(job)
+            except Exception:
+                logger.exception("Stage %s failed on %s" % (self.name, job.url))
+                job.skip = True
+        if self.next_stage is not None:
+            self.next_stage.put(job)
+
+    def stop(self):
+        """ Wait for the jobs already queued, then stop the workers. """
+        for thread in self.threads:
+            self.input_queue.put(STOP)
+        for thread in self.threads:
+            thread.join()
+
+
+class Pipeline():
+
+    def __init__(self, stages):
+        self.stages = stages
+        for stage, next_stage in zip(stages, stages[1:]):
+            stage.next_stage = next_stage
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+
+    def put(self, job):
+        """ Add a job to the first stage, blocks while it is full. """
+        self.stages[0].put(job)
+
+    def queue_depths(self):
+        """ Number of jobs waiting for each stage. The stage with the deepest queue is the bottleneck. """
+        return {stage.name: stage.depth() for stage in self.stages}
+
+    def max_queue_depths(self):
+        return {stage.name: stage.max_depth for stage in self.stages}
+
+    def close(self):
+        """ Finish every job in the pipeline and stop, stage by stage. """
+        for stage in self.stages:
+            stage.stop()
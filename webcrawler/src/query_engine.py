@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+
+__author__ = "L.J. Brown"
+__version__ = "1.0.1"
+
+import collections
+import logging
+import sys
+import threading
+
+# external
+import numpy as np
+
+# my lib
+from src import base_station
+from src import inverted_index
+from src import summary
+from src import text_processing
+
+# logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.FileHandler("output/output_log.txt"))
+logger.addHandler(logging.StreamHandler(sys.stdout))
+
+"""
+    Query Engine
+
+    Ranked retrieval over the inverted index of a crawl (see inverted_index.py, built with --index or --build-index).
+
+    Queries are tokenized with the same text_processing.plain_text_to_tokens rules as the crawled documents. Scoring is
+    term at a time: each query term's postings are decoded into numpy arrays and its weights are added into a per
+    document accumulator. Document lengths and the idf of every term are computed once when the engine is opened.
+
+        "bm25"      idf = log(1 + (N - df + 0.5) / (df + 0.5)),
+                    weight = idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * document length / average document length))
+        "tfidf"     idf = log(1 + N / df),  weight = idf * (1 + log(tf))
+
+    Both idfs stay above 0 for a term in every document, so a query whose terms are all that common still matches.
+
+    use:
+        engine = Query_Engine("name")
+        for result in engine.search("computer science", k=10):
+            print(result['score'], result['urls'])
+"""
+
+DEFAULT_SCORING = "bm25"
+DEFAULT_TOP_K = 10
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# collect the scored documents of a query by sorting their ids while there are fewer than 1 / UNIQUE_SCAN_RATIO
+# postings per document in the index, and by scanning the whole accumulator otherwise
+UNIQUE_SCAN_RATIO = 16
+
+
+def scoring_methods():
+    return ["bm25", "tfidf"]
+
+
+def decode_postings(data):
+    """ Vectorized inverted_index.decode_postings. Returns (document ids, term frequencies) as numpy uint64 arrays. """
+    data = np.frombuffer(data, dtype=np.uint8)
+    if len(data) == 0:
+        return np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.uint64)
+
+    # each varint ends on a byte below 0x80, its bytes hold 7 bits each, least significant first
+    ends = np.flatnonzero(data < 0x80)
+    if len(ends) == len(data):
+        # every value fits in one byte
+        values = data.astype(np.uint64)
+    else:
+        starts = np.concatenate(([0], ends[:-1] + 1))
+        byte_positions = np.arange(len(data)) - np.repeat(starts, ends - starts + 1)
+        values = np.add.reduceat((data & 0x7f).astype(np.uint64) << (7 * byte_positions).astype(np.uint64), starts)
+
+    # (document id delta, term frequency) pairs
+    return np.cumsum(values[0::2]), values[1::2]
+
+
+class Query_Engine():
+
+    def __init__(self, indexed_directory_name, stopwords_file=None, tokenizer=None, scoring=DEFAULT_SCORING, k1=BM25_K1, b=BM25_B):
+        """
+        :param indexed_directory_name: output directory of the crawl.
+        :param stopwords_file, tokenizer: as used for the crawl, so query terms match document terms.
+        :param scoring: one of scoring_methods().
+        :param k1, b: bm25 parameters.
+        """
+        if scoring not in scoring_methods():
+            raise ValueError("unknown scoring method: %s" % scoring)
+
+        self.indexed_directory_name = indexed_directory_name
+        self.stopwords_file = stopwords_file
+        self.tokenizer = tokenizer
+        self.scoring = scoring
+        self.k1, self.b = k1, b
+        self.lock = threading.Lock()
+
+        self.index = inverted_index.open_index(indexed_directory_name)
+
+        # precomputed idf per term position, and document lengths
+        number_of_documents = max(self.index.document_count, 1)
+        document_frequencies = np.frombuffer(self.index.lexicon, dtype=np.uint64).reshape(-1, inverted_index.LEXICON_FIELDS)[:, inverted_index.DOCUMENT_FREQUENCY].astype(np.float64)
+        if scoring == "bm25":
+            self.idf = np.log1p((number_of_documents - document_frequencies + 0.5) / (document_frequencies + 0.5))
+        else:
+            self.idf = np.log1p(number_of_documents / np.maximum(document_frequencies, 1))
+
+        self.document_lengths = np.frombuffer(self.index.document_lengths, dtype=np.uint64).astype(np.float64)
+        indexed_lengths = self.document_lengths[self.document_lengths > 0]
+        self.average_document_length = indexed_lengths.mean() if len(indexed_lengths) > 0 else 1.0
+        self.length_normalization = k1 * (1 - b + b * self.document_lengths / self.average_document_length)
+
+        # score accumulator, reset after every query
+        self.accumulator = np.zeros(len(self.document_lengths), dtype=np.float64)
+
+        # document id -> urls, loaded on first use
+        self.document_urls = None
+
+    def query_terms(self, query):
+        """ Returns {term: number of times in query} for query terms in the index. """
+        tokens = text_processing.plain_text_to_tokens(query, self.stopwords_file, self.tokenizer)
+        return {term: count for term, count in collections.Counter(tokens).items() if term in self.index}
+
+    def score(self, query):
+        """ Returns (document ids, scores) as numpy arrays of every document matching a query term. """
+        touched = []
+        for term, query_count in self.query_terms(query).items():
+            document_ids, term_frequencies = decode_postings(self.index.encoded_postings(term))
+            document_ids = document_ids.astype(np.intp)
+            term_frequencies = term_frequencies.astype(np.float64)
+            idf = self.idf[self.index.term_positions[term]]
+
+            if self.scoring == "bm25":
+                weights = idf * term_frequencies * (self.k1 + 1) / (term_frequencies + self.length_normalization[document_ids])
+            else:
+                weights = idf * (1 + np.log(term_frequencies))
+
+            # document ids are unique within a postings list
+            self.accumulator[document_ids] += query_count * weights
+            touched.append(document_ids)
+
+        if len(touched) == 0:
+            return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.float64)
+
+        # documents with a score: sort the touched ids when there are few, otherwise scan the accumulator
+        number_touched = sum(len(document_ids) for document_ids in touched)
+        if len(touched) == 1:
+            document_ids = touched[0]
+        elif number_touched * UNIQUE_SCAN_RATIO < len(self.accumulator):
+            document_ids = np.unique(np.concatenate(touched))
+        else:
+            document_ids = np.flatnonzero(self.accumulator)
+        scores = self.accumulator[document_ids]
+        self.accumulator[document_ids] = 0
+        return document_ids, scores
+
+    def top_k(self, query, k=DEFAULT_TOP_K):
+        """ Returns [(document id, score)] of the k best scoring documents, best first. """
+        with self.lock:
+            document_ids, scores = self.score(query)
+
+        # partial selection of the k largest, then sort only those
+        if len(scores) > k:
+            best = np.argpartition(-scores, k - 1)[:k]
+            document_ids, scores = document_ids[best], scores[best]
+        order = np.lexsort((document_ids, -scores))
+        return [(int(document_ids[i]), float(scores[i])) for i in order]
+
+    def load_document_urls(self):
+        """ document id -> urls with that content, through doc_hash_id_map and the web page summaries. """
+        document_indexer = base_station.Document_Indexer()
+        document_indexer.load_document_indexer()
+        hash_document_ids = document_indexer.hash_id_index.to_dict()
+
+        document_urls = collections.defaultdict(list)
+        for wps in sorted(summary.load_web_page_summaries(self.indexed_directory_name), key=lambda wps: wps.get('url_id', 0)):
+            document_id = hash_document_ids.get(wps.get('content_hash'))
+            if document_id is not None:
+                document_urls[document_id].append(wps['requested_url'])
+        return document_urls
+
+    def search(self, query, k=DEFAULT_TOP_K):
+        """ Returns the k best matching documents, best first, as [{'document_id', 'score', 'urls'}]. """
+        if self.document_urls is None:
+            self.document_urls = self.load_document_urls()
+        return [{'document_id': document_id, 'score': score, 'urls': self.document_urls.get(document_id, [])}
+                for document_id, score in self.top_k(query, k)]
+
+    def close(self):
+        self.index.close()
@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+
+__author__ = "L.J. Brown"
+__version__ = "1.0.1"
+
+import array
+import glob
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import threading
+
+# my lib
+from src import file_io
+
+# logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.FileHandler("output/output_log.txt"))
+logger.addHandler(logging.StreamHandler(sys.stdout))
+
+"""
+    Segment Store
+
+    Packs many small json records (web page summaries, document term frequency dictionaries) into a few
+    append-only files instead of one file per record.
+
+        store_directory/
+            segment_1.jsonl         one json record per line, a new segment is started past segment_size bytes
+            segment_2.jsonl
+            ...
+            offsets.bin             one packed (record id, segment, offset, length) entry per record
+
+    Record ids are small consecutive integers (url_id, document_id), so the offset index is held as flat
+    arrays indexed by id rather than a dictionary. Records are read through mmap.
+
+    use:
+        store = Segment_Store("collected_data/name/web_page_summaries_segments/")
+        store.append(url_id, web_page_summary)
+        web_page_summary = store.get(url_id)
+"""
+
+SEGMENT_FILE_NAME = "segment_%d.jsonl"
+OFFSETS_FILE_NAME = "offsets.bin"
+OFFSET_ENTRY = struct.Struct("<QIQI")     # record id, segment number, offset, length
+DEFAULT_SEGMENT_SIZE = 64 * 1024 * 1024
+
+
+class Segment_Store():
+
+    def __init__(self, store_directory, segment_size=DEFAULT_SEGMENT_SIZE):
+        """
+        :param store_directory: directory holding the segments and offset index, created if needed.
+        :param segment_size: size in bytes after which a new segment file is started.
+        """
+        self.store_directory = store_directory
+        self.segment_size = segment_size
+        self.lock = threading.Lock()
+
+        # offset index, position is the record id
+        self.segment_numbers = array.array('I')
+        self.offsets = array.array('q')
+        self.lengths = array.array('I')
+
+        # open read maps, segment number -> mmap
+        self.read_maps = {}
+
+        if not os.path.exists(store_directory):
+            os.makedirs(store_directory)
+        self._load_offsets()
+
+        # continue appending to the last segment
+        self.segment_number = max(1, len(self._segment_paths()))
+        self.segment_file = open(self._segment_path(self.segment_number), 'ab')
+        self.offsets_file = open(os.path.join(store_directory, OFFSETS_FILE_NAME), 'ab')
+
+    def _segment_path(self, segment_number):
+        return os.path.join(self.store_directory, SEGMENT_FILE_NAME % segment_number)
+
+    def _segment_paths(self):
+        return glob.glob(os.path.join(self.store_directory, SEGMENT_FILE_NAME.replace('%d', '*')))
+
+    def _load_offsets(self):
+        offsets_path = os.path.join(self.store_directory, OFFSETS_FILE_NAME)
+        if not os.path.isfile(offsets_path):
+            return
+
+        segment_sizes = {}
+        with open(offsets_path, 'rb') as offsets_file:
+            data = offsets_file.read()
+
+        # a torn last entry is ignored
+        for position in range(0, len(data) - OFFSET_ENTRY.size + 1, OFFSET_ENTRY.size):
+            record_id, segment_number, offset, length = OFFSET_ENTRY.unpack_from(data, position)
+
+            # skip entries whose record never reached the segment file
+            if segment_number not in segment_sizes:
+                segment_path = self._segment_path(segment_number)
+                segment_sizes[segment_number] = os.path.getsize(segment_path) if os.path.isfile(segment_path) else 0
+            if offset + length > segment_sizes[segment_number]:
+                continue
+
+            self._set_offset(record_id, segment_number, offset, length)
+
+    def _set_offset(self, record_id, segment_number, offset, length):
+        if record_id >= len(self.offsets):
+            missing = record_id + 1 - len(self.offsets)
+            self.segment_numbers.extend([0] * missing)
+            self.offsets.extend([-1] * missing)
+            self.lengths.extend([0] * missing)
+        self.segment_numbers[record_id] = segment_number
+        self.offsets[record_id] = offset
+        self.lengths[record_id] = length
+
+    def append(self, record_id, record):
+        """ Write record under the integer record_id. A later record with the same id replaces it. """
+        line = json.dumps(record).encode('utf-8')
+
+        with self.lock:
+            # start a new segment once the current one is full
+            offset = self.segment_file.tell()
+            if offset > 0 and offset + len(line) > self.segment_size:
+                self.segment_file.close()
+                self.segment_number += 1
+                self.segment_file = open(self._segment_path(self.segment_number), 'ab')
+                offset = 0
+
+            self.segment_file.write(line + b'\n')
+            self.offsets_file.write(OFFSET_ENTRY.pack(int(record_id), self.segment_number, offset, len(line)))
+            self._set_offset(int(record_id), self.segment_number, offset, len(line))
+
+    def _read(self, record_id):
+        segment_number, offset, length = self.segment_numbers[record_id], self.offsets[record_id], self.lengths[record_id]
+
+        # (re)map the segment if it has grown past the current map
+        read_map = self.read_maps.get(segment_number)
+        if read_map is None or offset + length > len(read_map):
+            if segment_number == self.segment_number:
+                self.segment_file.flush()
+            if read_map is not None:
+                read_map.close()
+            with open(self._segment_path(segment_number), 'rb') as segment_file:
+                read_map = mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.read_maps[segment_number] = read_map
+
+        return json.loads(read_map[offset:offset + length])
+
+    def get(self, record_id):
+        """ Return the record stored under record_id, or None. """
+        with self.lock:
+            if record_id >= len(self.offsets) or self.offsets[record_id] < 0:
+                return None
+            return self._read(record_id)
+
+    def ids(self):
+        return [record_id for record_id in range(len(self.offsets)) if self.offsets[record_id] >= 0]
+
+    def __iter__(self):
+        """ Yields records in record id order. """
+        for record_id in self.ids():
+            yield self.get(record_id)
+
+    def __contains__(self, record_id):
+        return record_id < len(self.offsets) and self.offsets[record_id] >= 0
+
+    def __len__(self):
+        return len(self.ids())
+
+    def flush(self):
+        with self.lock:
+            self.segment_file.flush()
+            self.offsets_file.flush()
+
+    def close(self):
+        with self.lock:
+            for read_map in self.read_maps.values():
+                read_map.close()
+            self.read_maps = {}
+            self.segment_file.close()
+            self.offsets_file.close()
+
+
+#
+#   Stores of a crawl
+#
+
+def web_page_summary_store(indexed_directory_name):
+    return Segment_Store(file_io.get_path('web_page_summaries_segment_directory_path', [indexed_directory_name], force=True))
+
+
+def document_store(indexed_directory_name):
+    return Segment_Store(file_io.get_path('documents_segment_directory_path', [indexed_directory_name], force=True))
+
+
+def store_directory(indexed_directory_name, store_directory_type):
+    return file_io.get_template(store_directory_type) % indexed_directory_name
+
+
+def has_segment_store(indexed_directory_name, store_directory_type):
+    """ Returns True if the crawl has a segment store of store_directory_type, without creating it. """
+    return os.path.isdir(store_directory(indexed_directory_name, store_directory_type))
+
+
+def has_segment_stores(indexed_directory_name):
+    """ Returns True if any record of the crawl was stored in segments. """
+    return has_segment_store(indexed_directory_name, 'web_page_summaries_segment_directory_path') or \
+           has_segment_store(indexed_directory_name, 'documents_segment_directory_path')
+
+
+def convert_directory(indexed_directory_name):
+    """ Pack the one file per record layout of a crawl into segment stores. The original files are left in place. """
+
+    conversions = [
+        ('web_page_summary_file_path', web_page_summary_store, 'url_id'),
+        ('document_frequency_dict_file_path', document_store, 'document_id')
+    ]
+
+    for template_type, make_store, id_key in conversions:
+        file_template = file_io.get_template(template_type) % (indexed_directory_name, '*')
+        records = []
+        for file_path in glob.glob(file_template):
+            with open(file_path) as json_data:
+                records.append(json.load(json_data))
+
+        store = make_store(indexed_directory_name)
+        for record in sorted(records, key=lambda r: r[id_key]):
+            store.append(record[id_key], record)
+        store.close()
+
+        logger.info("Packed %d %s files into %s" % (len(records), template_type, store.store_directory))
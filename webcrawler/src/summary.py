@@ -1,4 +1,5 @@
-import json
+import array
+import collections
 import logging
 import sys
 
@@ -6,10 +7,12 @@ import sys
 from src import utils
 from src import file_io
 from src import base_station
+from src import crawl_dataset
 
 # external
-import glob
+import numpy as np
 import pandas as pd
+import scipy.sparse
 
 # logging
 logging.basicConfig(level=logging.INFO)
@@ -17,7 +20,11 @@ logger = logging.getLogger(__name__)
 logger.addHandler(logging.FileHandler("output/output_log.txt"))
 logger.addHandler(logging.StreamHandler(sys.stdout))
 
-def display_summary(indexed_directory_name):
+# sparse document term frequency matrix, a row per document id and a column per term
+Document_Term_Matrix = collections.namedtuple('Document_Term_Matrix', ['matrix', 'document_ids', 'terms'])
+
+
+def display_summary(indexed_directory_name, dense=False, online=False):
 
     log_info = load_log_file(indexed_directory_name)
     seed_url = log_info['seed_url']
@@ -28,7 +35,7 @@ def display_summary(indexed_directory_name):
 
     indexed_urls = pd.DataFrame(list(url_id_map.items()),
                  columns=['URL', 'ID'])
-    indexed_urls = indexed_urls.sort('ID').set_index('ID')
+    indexed_urls = indexed_urls.sort_values('ID').set_index('ID')
 
     # display urls collected
     print("\n\n\n\n\n\nNumber new of indexed Urls for site \"%s\" is %s\n" % (seed_url, len(indexed_urls)))
@@ -41,9 +48,15 @@ def display_summary(indexed_directory_name):
 
     # display out of bounds sites
     print("\nURLs leading out of seed website: %s " % seed_url)
-    out_of_bounds_urls = get_out_of_bounds_urls(indexed_directory_name)
+    out_of_bounds_urls = get_out_of_bounds_urls(indexed_directory_name, online=online)
     print(pd.DataFrame(out_of_bounds_urls, columns=["Out of bounds URLs"]))
 
+    # out of bounds urls never resolved by the crawl, listed as found
+    if not online:
+        print("\nOut of bounds URLs without a saved resolution (use --online-report to resolve them):")
+        unresolved_urls = get_unresolved_out_of_bounds_urls(indexed_directory_name)
+        print(pd.DataFrame(unresolved_urls, columns=["Unresolved URLs"]))
+
     # display graphic urls
     print("\nGraphic URLs indexed: ")
     graphic_urls = get_graphic_urls(indexed_directory_name)
@@ -55,66 +68,83 @@ def display_summary(indexed_directory_name):
     #, columns=["Duplicate Content URLs"]
     print(pd.DataFrame(duplicate_content_urls))
 
+    # display urls pointing to near duplicate content, indexed as one document
+    print("\nURLs with near duplicate content:")
+    near_duplicate_content_urls = get_urls_with_near_duplicate_content(indexed_directory_name)
+    print(pd.DataFrame(near_duplicate_content_urls))
+
     # print document term frequency matrix
     print("\n\nDocument Term Frequency Matrix \n")
-    dtfm = get_document_term_frequency_matrix(indexed_directory_name)
-    print(dtfm)
+    dtfm = get_document_term_frequency_matrix(indexed_directory_name, dense=dense)
+    if dense:
+        print(dtfm)
+        dtfm_corpus_term_freq = dtfm.sum()
+    else:
+        print("%d documents x %d terms, %d non zero frequencies" % (dtfm.matrix.shape[0], dtfm.matrix.shape[1], dtfm.matrix.nnz))
+        dtfm_corpus_term_freq = pd.Series(np.asarray(dtfm.matrix.sum(axis=0)).ravel(), index=dtfm.terms)
 
     # display most frequently occurring terms
     print("\n 20 Most Frequently occuring terms")
-    dtfm_corpus_term_freq = dtfm.sum()
-    dtfm_corpus_term_freq.columns = ['term', 'frequency']
     print(dtfm_corpus_term_freq.sort_values(axis=0, ascending=False).head(n=20))
 
 
 def load_log_file(indexed_directory_name):
-    log_file_path = file_io.get_path('log_file', [indexed_directory_name])
-    if log_file_path is not None:
-        with open(log_file_path) as json_data:
-            log_info = json.load(json_data)
-    return log_info
+    return crawl_dataset.get_crawl_dataset(indexed_directory_name).log_info()
 
 def load_web_page_summaries(indexed_directory_name):
-
-    web_page_summaries_file_template = file_io.get_template('web_page_summary_file_path') % (indexed_directory_name, '*')
-
-    web_page_summaries_list = []
-    for wpsf_path in glob.glob(web_page_summaries_file_template):
-        with open(wpsf_path) as json_data:
-            wps = json.load(json_data)
-            web_page_summaries_list.append(wps)
-    return web_page_summaries_list
+    """ Every web page summary of the crawl, parsed once and shared. Do not modify. """
+    return crawl_dataset.get_crawl_dataset(indexed_directory_name).web_page_summaries()
 
 def load_document_frequency_dicts(indexed_directory_name):
-    document_frequency_dict_file_template = file_io.get_template('document_frequency_dict_file_path') % (indexed_directory_name, '*')
-
-    document_id_term_frequency_dict = {}
-    for dfd_path in glob.glob(document_frequency_dict_file_template):
-        with open(dfd_path) as json_data:
-            dfd = json.load(json_data)
-            doc_id = str(dfd['document_id'])
-            doc_term_freq_dict = dfd['term_frequency_dict']
-            document_id_term_frequency_dict[doc_id] = doc_term_freq_dict
+    """ Document id -> term frequency dictionary, parsed once and shared. Do not modify. """
+    return crawl_dataset.get_crawl_dataset(indexed_directory_name).document_frequency_dicts()
 
-    return document_id_term_frequency_dict
+def load_url_resolver(online=False):
+    """ URL_Resolver holding the resolutions saved by the crawl. Offline it answers from them without any
+        network requests, online it requests only urls the crawl never resolved. Nothing is written back. """
+    url_indexer = base_station.URL_Indexer()
+    url_indexer.load_url_indexer()
+    url_resolver = url_indexer.url_resolver
+    url_resolver.journal = None
+    if not online:
+        url_resolver.method = "offline"
+    return url_resolver
 
-def get_out_of_bounds_urls(indexed_directory_name):
+def get_a_hrefs(indexed_directory_name):
     wps_list = load_web_page_summaries(indexed_directory_name)
-    log_info = load_log_file(indexed_directory_name)
-    seed_url = log_info['seed_url']
-
 
     all_urls = []
     for wps in wps_list:
         if 'normalized_a_hrefs' in wps:
             all_urls += wps['normalized_a_hrefs']
+    return all_urls
 
-    url_resolver = utils.URL_Resolver()
-    all_urls = url_resolver.resolve_list(all_urls, collapse=True)
+def get_out_of_bounds_urls(indexed_directory_name, online=False):
+    """ Resolved links leading out of the seed website. Offline, links the crawl never resolved are left out,
+        they are listed by get_unresolved_out_of_bounds_urls. """
+    log_info = load_log_file(indexed_directory_name)
+    seed_url = log_info['seed_url']
+
+    url_resolver = load_url_resolver(online)
+    a_hrefs = get_a_hrefs(indexed_directory_name)
+    resolved_urls = url_resolver.resolve_list(a_hrefs)
+    all_urls = list(set(resolved_url for url, resolved_url in zip(a_hrefs, resolved_urls)
+                        if url not in url_resolver.unresolved_urls))
 
     out_of_bounds_urls = utils.filter_sub_directories(all_urls, [seed_url], filter_if_sub=True)
     return out_of_bounds_urls
 
+def get_unresolved_out_of_bounds_urls(indexed_directory_name):
+    """ Links leading out of the seed website with no saved resolution, as written in the pages. """
+    log_info = load_log_file(indexed_directory_name)
+    seed_url = log_info['seed_url']
+
+    url_resolver = load_url_resolver(online=False)
+    url_resolver.resolve_list(get_a_hrefs(indexed_directory_name))
+
+    unresolved_urls = sorted(url_resolver.unresolved_urls)
+    return utils.filter_sub_directories(unresolved_urls, [seed_url], filter_if_sub=True)
+
 def get_graphic_urls(indexed_directory_name):
     wps_list = load_web_page_summaries(indexed_directory_name)
     log_info = load_log_file(indexed_directory_name)
@@ -167,25 +197,64 @@ def get_urls_with_duplicate_content(indexed_directory_name):
     return urls_with_duplicate_content
 
 
-def get_document_term_frequency_matrix(indexed_directory_name, write=True):
-    id_tf_dict = load_document_frequency_dicts(indexed_directory_name)
+def get_urls_with_near_duplicate_content(indexed_directory_name):
+    """ Groups of urls with different content indexed as one document, found by the near duplicate index (--near-duplicates). """
+    document_indexer = base_station.Document_Indexer()
+    document_indexer.load_document_indexer()
+    hash_document_ids = document_indexer.hash_id_index.to_dict()
 
-    unique_words = set()
-    for doc_id, tf_dict in id_tf_dict.items():
-        unique_words = unique_words | set(tf_dict.keys())
+    # document id -> content hash -> urls
+    document_content_urls = {}
+    for wps in load_web_page_summaries(indexed_directory_name):
+        document_id = hash_document_ids.get(wps.get('content_hash'))
+        if document_id is not None:
+            content_urls = document_content_urls.setdefault(document_id, {})
+            content_urls.setdefault(wps['content_hash'], []).append(wps['requested_url'])
 
-    doc_freq_matrix = pd.DataFrame(columns=unique_words)
-    for doc_id, tf_dict in id_tf_dict.items():
-        terms, freqs = zip(*tf_dict.items())
-        df = pd.DataFrame(data=[freqs], columns=terms, index=[doc_id])
-        doc_freq_matrix = pd.merge(doc_freq_matrix, df, how='outer')
+    urls_with_near_duplicate_content = []
+    for document_id, content_urls in sorted(document_content_urls.items()):
+        if len(content_urls) > 1:
+            urls_with_near_duplicate_content.append([url for urls in content_urls.values() for url in urls])
 
-    doc_freq_matrix = doc_freq_matrix.fillna(value=0)
+    return urls_with_near_duplicate_content
 
-    # write to csv
-    if write:
-        logger.info("Writing Document Term Frequency Matrix")
-        matrix_file = file_io.get_path("document_term_frequency_matrix_file_path", None, force=True)
-        doc_freq_matrix.to_csv(matrix_file)
 
-    return doc_freq_matrix
+def get_document_term_frequency_matrix(indexed_directory_name, write=True, dense=False):
+    """ Build the document term frequency matrix in one pass over the documents.
+        Returns a Document_Term_Matrix holding a scipy.sparse csr matrix, and writes its non zero entries as
+        (document_id, term, frequency) rows. With dense=True returns and writes a pandas DataFrame indexed by
+        document id with a column per term instead, which needs memory for every document and term pair. """
+    id_tf_dict = load_document_frequency_dicts(indexed_directory_name)
+
+    # term -> column, in order of first appearance
+    vocabulary = {}
+    document_ids = sorted(int(doc_id) for doc_id in id_tf_dict)
+    rows, columns, frequencies = array.array('i'), array.array('i'), array.array('q')
+    for row, doc_id in enumerate(document_ids):
+        for term, frequency in id_tf_dict[str(doc_id)].items():
+            rows.append(row)
+            columns.append(vocabulary.setdefault(term, len(vocabulary)))
+            frequencies.append(frequency)
+
+    matrix = scipy.sparse.csr_matrix((np.frombuffer(frequencies, dtype=np.int64), (np.frombuffer(rows, dtype=np.int32), np.frombuffer(columns, dtype=np.int32))),
+                                     shape=(len(document_ids), len(vocabulary)))
+    terms = list(vocabulary)
+
+    if dense:
+        doc_freq_matrix = pd.DataFrame(matrix.toarray(), index=document_ids, columns=terms)
+        if write:
+            logger.info("Writing Document Term Frequency Matrix")
+            matrix_file = file_io.get_path("document_term_frequency_matrix_file_path", None, force=True)
+            doc_freq_matrix.to_csv(matrix_file)
+        return doc_freq_matrix
+
+    document_term_matrix = Document_Term_Matrix(matrix, document_ids, terms)
+    if write:
+        logger.info("Writing Document Term Frequencies")
+        coo = matrix.tocoo()
+        triples = pd.DataFrame({'document_id': np.asarray(document_ids, dtype=np.int64)[coo.row],
+                                'term': np.asarray(terms, dtype=object)[coo.col],
+                                'frequency': coo.data})
+        triples_file = file_io.get_path("document_term_frequency_triples_file_path", None, force=True)
+        triples.to_csv(triples_file, index=False)
+    return document_term_matrix
@@ -3,9 +3,12 @@
 __author__ = "L.J. Brown"
 __version__ = "1.0.1"
 
+import functools
 import logging
+import re
 import string
 import sys
+import unicodedata
 
 # external
 import nltk
@@ -19,25 +22,87 @@ logger.addHandler(logging.FileHandler("output/output_log.txt"))
 logger.addHandler(logging.StreamHandler(sys.stdout))
 
 
+# number of distinct words whose stems are cached
+STEM_CACHE_SIZE = 2 ** 16
+
+# shared stemmer
+porter_stemmer = PorterStemmer()
+
+
+# Tokenizers
+
+DEFAULT_TOKENIZER = "nltk"
+
+
+def tokenizers():
+    return ["nltk", "regex"]
+
+
+# characters nltk.word_tokenize always splits on
+SEPARATORS = r"\s;@#$%&?!*()\[\]{}<>\"`«“‘„»”’\u2012-\u2015"
+
+# end of a word: a separator, a comma or colon not followed by a digit, a run of periods or dashes, or the end of the text
+WORD_BOUNDARY = r"(?=\.?(?:[" + SEPARATORS + r"]|[,:](?!\d)|\.\.|--|$))"
+
+# split off clitics the way nltk does ("don't" -> "do n't", "city's" -> "city 's"). nltk splits 's 'm 'd ' before
+# 'll 're 've n't, so one of the latter is also split when followed by one of the former ("didn't's" -> "did n't 's")
+CLITIC_PATTERN = re.compile(r"(?<=[^'" + SEPARATORS + r"])('[sSmMdD]|'ll|'LL|'re|'RE|'ve|'VE|n't|N'T|')(?:" + WORD_BOUNDARY +
+                            r"|(?<='ll|'LL|'re|'RE|'ve|'VE|n't|N'T)(?='[sSmMdD]?" + WORD_BOUNDARY + r"))")
+
+# split the MacIntyre contractions nltk splits ("cannot" -> "can not"), padding both parts with spaces like nltk
+CONTRACTION_PATTERN = re.compile(r"(?i)\b(can(?=not\b)|gim(?=me\b)|gon(?=na\b)|got(?=ta\b)|lem(?=me\b)|wan(?=na\b))(\w+)")
+
+# a word never starts with an apostrophe, may contain single periods and dashes, and commas or colons followed by a digit.
+# like nltk, a comma or colon following another one is kept on the front of the next word ("::new" -> ":new").
+# a trailing period is left out, nltk splits it off the end of a sentence
+WORD_CHARACTER = r"[^,:.\-" + SEPARATORS + r"]"
+WORD_PATTERN = re.compile(r"(?!')(?:(?<=[,:])[,:])?(?:" + WORD_CHARACTER + r"|[,:](?=\d)|(?<!\.)\.(?=" + WORD_CHARACTER + r")|(?<!-)-(?!-))+")
+
+
+def regex_word_tokenize(text):
+    """ Split text into words with precompiled regular expressions. Needs no nltk data and keeps the words of
+    nltk.word_tokenize that plain_text_to_tokens does not filter out, except that every word ending in a
+    period is treated as the end of a sentence, abbreviations included. """
+    text = CONTRACTION_PATTERN.sub(r" \1 \2 ", text)
+    text = CLITIC_PATTERN.sub(r" \1", text)
+    return WORD_PATTERN.findall(text)
+
+
 # Text Processing
 
-def extract_words(sentence):
-    """ Extract words from raw document and return list """
+def extract_words(sentence, tokenizer=None):
+    """ Extract words from raw document and return list
+
+    :param tokenizer: one of tokenizers(). "nltk" uses nltk.word_tokenize, "regex" uses regex_word_tokenize.
+    """
+    if tokenizer is None:
+        tokenizer = DEFAULT_TOKENIZER
+    if tokenizer not in tokenizers():
+        raise ValueError("unknown tokenizer: %s" % tokenizer)
+
+    if tokenizer == "regex":
+        return regex_word_tokenize(sentence)
+
     words = nltk.word_tokenize(sentence)
     return words
 
 
+@functools.lru_cache(maxsize=None)
+def english_stopwords():
+    """ nltk english stop words, loaded once """
+    return frozenset(nltk.corpus.stopwords.words('english'))
+
+
 def is_stopword(word):
     """ Return True of word is in stop word list """
-    stop_words = nltk.corpus.stopwords.words('english')
-    return word in stop_words
+    return word in english_stopwords()
 
 
+@functools.lru_cache(maxsize=None)
 def list_from_stopwords_file(stopwords_file):
-    plain_text = None
+    """ Return the tokens of a one word per line stopwords file, as plain_text_to_tokens makes them, read once per file """
     with open(stopwords_file) as sf:
-        plain_text = sf.read()
-    return plain_text_to_tokens(plain_text)
+        return frozenset(plain_text_to_tokens(sf.read()))
 
 
 def is_punctuation(word):
@@ -55,7 +120,6 @@ def is_number(word):
     except ValueError:
         logger.debug('ValueError is_number')
     try:
-        import unicodedata
         unicodedata.numeric(word)
         return True
     except (TypeError, ValueError):
@@ -70,10 +134,10 @@ def is_shorter(word, n=3):
     return False
 
 
+@functools.lru_cache(maxsize=STEM_CACHE_SIZE)
 def stem(word):
     """ stem word with PorterStemmer """
-    ps = PorterStemmer()
-    return ps.stem(word)
+    return porter_stemmer.stem(word)
 
 
 def alphabetic_start(word):
@@ -90,44 +154,42 @@ def alphanumeric_end(word):
     return False
 
 
-def plain_text_to_tokens(plain_text, stopwords_file=None):
+def plain_text_to_tokens(plain_text, stopwords_file=None, tokenizer=None):
     """ tokenize sentence, convert to lower, stem, remove stop words, numbers, punctuation"""
     logger.debug('Cleaning Plain Text')
 
     assert plain_text is not None
 
-    # tokenize sentence
-    tokens = extract_words(plain_text)
-
-    # lower
-    tokens = [t.lower() for t in tokens]
-
-    # remove words with no alphabetic start characters
-    tokens = [w for w in tokens if alphabetic_start(w)]
-
-    # remove words with no alphanumeric end characters
-    tokens = [w for w in tokens if alphanumeric_end(w)]
-
-    # remove stop words
+    # stop words
     if stopwords_file is None:
-        tokens = [w for w in tokens if not is_stopword(w)]
+        stopwords = english_stopwords()
     else:
         stopwords = list_from_stopwords_file(stopwords_file)
-        tokens = [w for w in tokens if w not in stopwords]
 
-    # remove punctuation
-    tokens = [w for w in tokens if not is_punctuation(w)]
+    # tokenize sentence, then filter and stem every token in a single pass
+    tokens = []
+    for token in extract_words(plain_text, tokenizer):
+
+        # lower
+        word = token.lower()
+
+        # remove words with no alphabetic start or alphanumeric end characters
+        # (so never entirely punctuation)
+        if not word or not alphabetic_start(word) or not alphanumeric_end(word):
+            continue
 
-    # remove short
-    tokens = [w for w in tokens if not is_shorter(w)]
+        # remove short and stop words
+        if is_shorter(word) or word in stopwords:
+            continue
 
-    # remove number
-    tokens = [w for w in tokens if not is_number(w)]
+        # remove number
+        if is_number(word):
+            continue
 
-    # stem words
-    tokens = map(stem, tokens)
+        # stem words
+        tokens.append(stem(word))
 
-    return list(tokens)
+    return tokens
 
 
 # Text Statistics
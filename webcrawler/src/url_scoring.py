@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+
+__author__ = "L.J. Brown"
+__version__ = "1.0.1"
+
+import collections
+import logging
+import mimetypes
+import posixpath
+from urllib.parse import urlparse
+
+# logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+"""
+    URL Scoring for utils.Priority_URL_Frontier
+
+    Lower scores are crawled first. A URL_Scorer adds up weighted criteria:
+
+        "depth"     link depth, the fewest links followed from the seed url to the url
+        "inlinks"   number of links seen pointing at the url, more links score lower
+        "type"      content type guessed from the url extension: pages, then documents, then media
+
+    With a directory budget, urls in a directory that has already had that many urls dispatched
+    are moved behind every url from a directory still within budget.
+"""
+
+# guessed content type costs for the "type" criterion
+PAGE_COST, DOCUMENT_COST, MEDIA_COST = 0, 1, 3
+PAGE_TYPES = ("text/html", "text/plain", "application/xhtml+xml")
+MEDIA_TYPE_PREFIXES = ("image/", "video/", "audio/", "font/")
+MEDIA_TYPES = ("application/zip", "application/x-tar", "application/gzip", "application/octet-stream")
+
+OVER_BUDGET_COST = 10 ** 6
+
+
+def scoring_criteria():
+    return ["depth", "inlinks", "type"]
+
+
+def directory(url):
+    """ Return the url up to and including its last '/'. """
+    return url[:url.rfind('/') + 1]
+
+
+def guess_type_cost(url):
+    """ Cost of a url by the content type guessed from its extension. Urls with no extension are assumed to be pages. """
+    path = urlparse(url).path
+    if path == '' or path.endswith('/') or posixpath.splitext(path)[1] == '':
+        return PAGE_COST
+
+    content_type, encoding = mimetypes.guess_type(path)
+    if content_type is None or content_type in PAGE_TYPES:
+        return PAGE_COST
+    if content_type.startswith(MEDIA_TYPE_PREFIXES) or content_type in MEDIA_TYPES:
+        return MEDIA_COST
+    return DOCUMENT_COST
+
+
+class URL_Scorer():
+    """ Callable score function for utils.Priority_URL_Frontier. """
+
+    def __init__(self, seed_url, criteria=("depth",), weights=None, directory_budget=None):
+        """
+        :param seed_url: resolved seed url, link depth is measured from here.
+        :param criteria: names from scoring_criteria() to add together.
+        :param weights: optional dictionary of criteria name to weight, each defaults to 1.
+        :param directory_budget: optional maximum number of urls to dispatch per directory before its urls are deferred.
+        """
+        for name in criteria:
+            if name not in scoring_criteria():
+                raise ValueError("unknown scoring criteria: %s" % name)
+
+        self.seed_url = seed_url
+        self.criteria = tuple(criteria)
+        self.weights = weights or {}
+        self.directory_budget = directory_budget
+
+        self.inlinks = collections.Counter()
+        self.dispatched = collections.Counter()
+
+        # url -> fewest links from the seed url, for urls found so far
+        self.link_depths = {seed_url: 0}
+
+    def observe_links(self, urls):
+        """ Count links pointing at each url, used by the "inlinks" criteria. """
+        if "inlinks" in self.criteria:
+            self.inlinks.update(urls)
+
+    def observe_depths(self, parent_url, urls):
+        """ Record urls linked from the page at parent_url, one link deeper than it, used by the "depth" criteria.
+            returns a dictionary of the urls whose depth was lowered (or first set) to their new depth. """
+        changed_depths = {}
+        if "depth" in self.criteria:
+            depth = self.link_depths.get(parent_url, 0) + 1
+            for url in urls:
+                if depth < self.link_depths.get(url, depth + 1):
+                    self.link_depths[url] = depth
+                    changed_depths[url] = depth
+        return changed_depths
+
+    def restore_depths(self, link_depths):
+        """ Restore depths recorded with observe_depths, keeping the lowest. """
+        for url, depth in link_depths.items():
+            if depth < self.link_depths.get(url, depth + 1):
+                self.link_depths[url] = depth
+
+    def observe_dispatch(self, url):
+        """ Record a url leaving the frontier, used by the directory budget. """
+        if self.directory_budget is not None:
+            self.dispatched[directory(url)] += 1
+
+    def depth(self, url):
+        return self.link_depths.get(url, 0)
+
+    def __call__(self, url):
+        score = 0
+        for name in self.criteria:
+            if name == "depth":
+                value = self.depth(url)
+            elif name == "inlinks":
+                value = -self.inlinks[url]
+            else:
+                value = guess_type_cost(url)
+            score += self.weights.get(name, 1) * value
+
+        if self.directory_budget is not None and self.dispatched[directory(url)] >= self.directory_budget:
+            score += OVER_BUDGET_COST
+
+        return score
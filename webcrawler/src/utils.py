@@ -1,8 +1,18 @@
+import array
+import collections
+import hashlib
+import heapq
+import itertools
 import logging
 import os
-import requests
 import json
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, urlunsplit
+
+# my lib
+from src import http_client
 
 
 # logging
@@ -11,6 +21,132 @@ logger = logging.getLogger(__name__)
 logger.addHandler(logging.FileHandler("output/output_log.txt"))
 logger.addHandler(logging.StreamHandler(sys.stdout))
 
+"""
+
+Journal
+
+    Append-only log of new [key, value] records, one json list per line. Lets a map persist each new
+    entry with O(1) I/O, and be rebuilt by loading its last snapshot then replaying the journal.
+    Records are held in memory until flush(), so none reach the file before the caller chooses to write them.
+"""
+
+# a journal is compacted into its snapshot once it holds more than this fraction of the snapshot's entries,
+# so snapshots grow geometrically and each journaled entry is rewritten by compactions O(1) times on average
+COMPACTION_FRACTION = 0.5
+
+
+def compaction_due(journal_entries, snapshot_entries):
+    return journal_entries > COMPACTION_FRACTION * snapshot_entries
+
+
+class Journal():
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        directory_path = os.path.split(file_path)[0]
+        if directory_path != '' and not os.path.exists(directory_path):
+            os.makedirs(directory_path)
+
+        # records already in the journal, written before a resumed crawl
+        self.records = 0
+        if os.path.isfile(file_path):
+            with open(file_path) as journal_file:
+                self.records = sum(1 for _ in journal_file)
+        self.file = open(file_path, 'a')
+        self.pending_lines = []
+
+    def append(self, key, value):
+        self.pending_lines.append(json.dumps([key, value]) + '\n')
+        self.records += 1
+
+    def flush(self):
+        """ Write the records appended since the last flush. """
+        self.file.write(''.join(self.pending_lines))
+        self.pending_lines = []
+        self.file.flush()
+
+    def truncate(self):
+        """ Empty the journal, call once its records are in a snapshot. """
+        self.pending_lines = []
+        self.file.seek(0)
+        self.file.truncate()
+        self.records = 0
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    @staticmethod
+    def replay(file_path):
+        """ Yields (key, value) records in the order they were written. A torn last line is skipped. """
+        if not os.path.isfile(file_path):
+            return
+        with open(file_path) as journal_file:
+            for line in journal_file:
+                try:
+                    key, value = json.loads(line)
+                except ValueError:
+                    logger.warning("skipping incomplete journal record in %s" % file_path)
+                    continue
+                yield key, value
+
+
+"""
+
+Journaled Map
+
+    Mixin persisting a map as a json snapshot file and a Journal of the entries added since the snapshot.
+    Subclasses set self.journal = None and self.lock (a threading.Lock) in __init__, journal new entries
+    with journal_entry(key, value), and implement
+        snapshot()              the map written by compact()
+        restore(key, value)     add an entry read back from the snapshot or the journal by load()
+"""
+
+class Journaled_Map():
+
+    # entries in the last snapshot loaded or written
+    snapshot_entries = 0
+
+    def load(self, file_path, journal_path=None):
+        """ Load a snapshot file (may be None) then replay the journal written since it, if any. """
+        if file_path is not None:
+            with open(file_path) as json_data:
+                snapshot = json.load(json_data)
+            for key, value in snapshot.items():
+                self.restore(key, value)
+            self.snapshot_entries = len(snapshot)
+
+        if journal_path is not None:
+            for key, value in Journal.replay(journal_path):
+                self.restore(key, value)
+
+    def open_journal(self, journal_path):
+        """ Append every new entry to journal_path from now on. """
+        self.journal = Journal(journal_path)
+
+    def journal_entry(self, key, value):
+        if self.journal is not None:
+            self.journal.append(key, value)
+
+    def flush_journal(self):
+        if self.journal is not None:
+            with self.lock:
+                self.journal.flush()
+
+    def compaction_due(self):
+        """ True once the journal has outgrown COMPACTION_FRACTION of the last snapshot. """
+        return self.journal is not None and compaction_due(self.journal.records, self.snapshot_entries)
+
+    def compact(self, save):
+        """ Write a snapshot with save(snapshot()), then empty the journal. """
+        with self.lock:
+            snapshot = self.snapshot()
+            save(snapshot)
+            self.snapshot_entries = len(snapshot)
+            if self.journal is not None:
+                self.journal.truncate()
+
+
 """
 
 Incremental Hash ID
@@ -18,27 +154,45 @@ Incremental Hash ID
     "key": auto incremented integer value
 """
 
-class Incremental_Hash_ID():
+class Incremental_Hash_ID(Journaled_Map):
 
     def __init__(self):
         self.table = {}
         self.cur_id = 1
+        self.lock = threading.Lock()
+        self.journal = None
 
     def add(self, item):
-        if item in self.table:
-            logger.error("item: %s already in Incremental Hash ID" % item)
-        else:
-            self.table[item] = self.cur_id
-            self.cur_id += 1
+        # check and increment together so concurrent adds never share an id
+        with self.lock:
+            if item in self.table:
+                logger.error("item: %s already in Incremental Hash ID" % item)
+            else:
+                self.table[item] = self.cur_id
+                self.journal_entry(item, self.cur_id)
+                self.cur_id += 1
+
+    def add_alias(self, item, item_id):
+        """ Map item to the id of an item already added, without using a new id. """
+        with self.lock:
+            if item in self.table:
+                logger.error("item: %s already in Incremental Hash ID" % item)
+            else:
+                self.table[item] = item_id
+                self.journal_entry(item, item_id)
 
     def to_dict(self):
         return self.table
 
-    def load(self, file_path):
-        with open(file_path) as json_data:
-            #dict.clear(self)
-            #self.update(json.load(json_data))
-            self.table = json.load(json_data)
+    def snapshot(self):
+        return self.table
+
+    def restore(self, item, item_id):
+        self.table[item] = item_id
+
+    def load(self, file_path, journal_path=None):
+        super().load(file_path, journal_path)
+        if len(self.table) > 0:
             self.cur_id = max(self.table.values()) + 1
 
     def __getitem__(self, item):
@@ -60,13 +214,15 @@ class Incremental_Hash_ID():
 
 
 class URL_Frontier():
-    """ A queue data structure that ignores added duplicates"""
+    """ A queue data structure that ignores added duplicates. add, remove, len and membership are all O(1). """
 
     def __init__(self):
         self.q = Queue()
+        self.queued = set()
 
     def add(self, data):
-        if data not in self.q:
+        if data not in self.queued:
+            self.queued.add(data)
             self.q.add(data)
 
     def add_list(self, list):
@@ -74,20 +230,289 @@ class URL_Frontier():
             self.add(d)
 
     def remove(self):
-        return self.q.remove()
+        data = self.q.remove()
+        self.queued.discard(data)
+        return data
 
     def __len__(self):
         return len(self.q)
 
     def __contains__(self, item):
-        return item in self.q
+        return item in self.queued
 
     def to_list(self):
         return self.q.to_list()
 
+class Priority_URL_Frontier():
+    """
+        A priority queue of urls that ignores added duplicates. Urls with the lowest score_function(url) are removed
+        first, equal scores in the order they were added.
+
+        Backed by a heap with lazy priority updates. Re-adding a queued url whose score has changed pushes a new entry
+        and marks the old one removed, and a url whose score has changed while queued is pushed back when it reaches
+        the top, so scores may depend on state that changes during the crawl (inlink counts, directory budgets).
+    """
+
+    REMOVED = None
+
+    def __init__(self, score_function):
+        """
+        :param score_function: callable taking a url and returning a comparable score, lower is crawled first.
+        """
+        self.score_function = score_function
+        self.heap = []
+        self.entries = {}
+        self.counter = itertools.count()
+
+    def _push(self, data, priority):
+        entry = [priority, next(self.counter), data]
+        self.entries[data] = entry
+        heapq.heappush(self.heap, entry)
+
+    def add(self, data):
+        priority = self.score_function(data)
+        if data in self.entries:
+            entry = self.entries[data]
+            if entry[0] == priority:
+                return
+            # lazy update, the old entry is skipped when it is popped
+            entry[-1] = self.REMOVED
+        self._push(data, priority)
+
+    def add_list(self, list):
+        for d in list:
+            self.add(d)
+
+    def remove(self):
+        """
+        :returns: Returns and removes the url with the lowest score or None.
+        """
+        while len(self.heap) > 0:
+            priority, count, data = heapq.heappop(self.heap)
+            if data is self.REMOVED:
+                continue
+
+            # re-score, push back if the score changed while queued
+            current_priority = self.score_function(data)
+            if current_priority != priority:
+                self._push(data, current_priority)
+                continue
+
+            del self.entries[data]
+            return data
+        return None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, item):
+        return item in self.entries
+
+    def to_list(self):
+        return [entry[-1] for entry in sorted(self.entries.values())]
+
+class Fingerprint_Set():
+    """
+        Exact set of 64 bit fingerprints in a single array('Q') hash table with linear probing, 8 bytes per slot
+        with a third to two thirds of the slots used, 12 to 24 bytes per fingerprint. A python set of ints costs a set
+        entry and an int object per fingerprint, over 70 bytes.
+
+        use:
+            s = Fingerprint_Set()
+            s.add(fingerprint)          # True if it was not in the set
+            fingerprint in s
+            s.discard(fingerprint)
+    """
+
+    # slot values, fingerprints 0 and 1 are kept outside the table
+    EMPTY = 0
+    DELETED = 1
+    MINIMUM_CAPACITY = 1024
+
+    def __init__(self):
+        self.table = array.array('Q', bytes(8 * self.MINIMUM_CAPACITY))
+        self.mask = self.MINIMUM_CAPACITY - 1
+        self.length = 0
+        # slots holding a fingerprint or DELETED
+        self.used = 0
+        self.special_fingerprints = set()
+
+    def _find(self, key):
+        """ Returns (slot of key or -1, first slot key can be stored in). """
+        table, mask = self.table, self.mask
+        i = key & mask
+        free = -1
+        while True:
+            value = table[i]
+            if value == key:
+                return i, free
+            if value == self.EMPTY:
+                return -1, free if free >= 0 else i
+            if value == self.DELETED and free < 0:
+                free = i
+            i = (i + 1) & mask
+
+    def _resize(self):
+        """ Rebuild without DELETED slots, sized so at most half the slots are used. """
+        capacity = self.MINIMUM_CAPACITY
+        while capacity <= 2 * self.length:
+            capacity *= 2
+        old_table = self.table
+        self.table = array.array('Q', bytes(8 * capacity))
+        self.mask = capacity - 1
+        self.used = 0
+        for fingerprint in old_table:
+            if fingerprint > self.DELETED:
+                self.table[self._find(fingerprint)[1]] = fingerprint
+                self.used += 1
+
+    def add(self, fingerprint):
+        """ Add fingerprint. returns True if it was not already in the set. """
+        if fingerprint <= self.DELETED:
+            if fingerprint in self.special_fingerprints:
+                return False
+            self.special_fingerprints.add(fingerprint)
+            self.length += 1
+            return True
+
+        found, free = self._find(fingerprint)
+        if found >= 0:
+            return False
+        if self.table[free] == self.EMPTY:
+            self.used += 1
+        self.table[free] = fingerprint
+        self.length += 1
+        if 3 * self.used > 2 * len(self.table):
+            self._resize()
+        return True
+
+    def discard(self, fingerprint):
+        if fingerprint <= self.DELETED:
+            if fingerprint in self.special_fingerprints:
+                self.special_fingerprints.discard(fingerprint)
+                self.length -= 1
+            return
+
+        found, free = self._find(fingerprint)
+        if found >= 0:
+            self.table[found] = self.DELETED
+            self.length -= 1
+
+    def __contains__(self, fingerprint):
+        if fingerprint <= self.DELETED:
+            return fingerprint in self.special_fingerprints
+        return self._find(fingerprint)[0] >= 0
+
+    def __len__(self):
+        return self.length
+
+
+class Spilling_URL_Frontier():
+    """
+        A first in first out url frontier for crawls larger than memory. Ignores added duplicates.
+
+        Only a bounded head (next urls out) and tail (newest urls in) are held in memory. When the tail fills up it
+        is written to a segment file in spill_directory, and when the head runs out the oldest segment is read back
+        in bulk. Duplicates are detected with a Fingerprint_Set of 8 byte url fingerprints instead of the url strings.
+
+        use:
+            f = Spilling_URL_Frontier("collected_data/name/frontier/", memory_limit=100000)
+    """
+
+    SEGMENT_FILE_NAME = "frontier_segment_%d.txt"
+
+    def __init__(self, spill_directory, memory_limit=100000):
+        """
+        :param spill_directory: directory for segment files, created if needed. Old segments are removed.
+        :param memory_limit: maximum number of urls held in memory, split between head and tail.
+        """
+        self.spill_directory = spill_directory
+        self.segment_size = max(1, memory_limit // 2)
+
+        self.head = collections.deque()
+        self.tail = collections.deque()
+        self.segments = collections.deque()
+        self.next_segment_number = 1
+        self.fingerprints = Fingerprint_Set()
+        self.length = 0
+
+        if not os.path.exists(spill_directory):
+            os.makedirs(spill_directory)
+        for file_name in os.listdir(spill_directory):
+            if file_name.startswith("frontier_segment_"):
+                os.remove(os.path.join(spill_directory, file_name))
+
+    @staticmethod
+    def fingerprint(url):
+        return int.from_bytes(hashlib.blake2b(url.encode('utf-8'), digest_size=8).digest(), 'big')
+
+    def _spill_tail(self):
+        segment_path = os.path.join(self.spill_directory, self.SEGMENT_FILE_NAME % self.next_segment_number)
+        self.next_segment_number += 1
+        with open(segment_path, 'w') as segment_file:
+            segment_file.write('\n'.join(self.tail))
+            segment_file.write('\n')
+        self.segments.append(segment_path)
+        self.tail.clear()
+
+    def _refill_head(self):
+        if len(self.segments) > 0:
+            segment_path = self.segments.popleft()
+            with open(segment_path) as segment_file:
+                self.head.extend(segment_file.read().splitlines())
+            os.remove(segment_path)
+        else:
+            self.head, self.tail = self.tail, self.head
+
+    def add(self, data):
+        if not self.fingerprints.add(self.fingerprint(data)):
+            return
+        self.length += 1
+
+        # skip the disk while nothing older is spilled
+        if len(self.segments) == 0 and len(self.tail) == 0 and len(self.head) < self.segment_size:
+            self.head.append(data)
+            return
+
+        self.tail.append(data)
+        if len(self.tail) >= self.segment_size:
+            self._spill_tail()
+
+    def add_list(self, list):
+        for d in list:
+            self.add(d)
+
+    def remove(self):
+        """
+        :returns: Returns and removes the oldest url or None.
+        """
+        if self.length == 0:
+            return None
+        if len(self.head) == 0:
+            self._refill_head()
+
+        data = self.head.popleft()
+        self.fingerprints.discard(self.fingerprint(data))
+        self.length -= 1
+        return data
+
+    def __len__(self):
+        return self.length
+
+    def __contains__(self, item):
+        return self.fingerprint(item) in self.fingerprints
+
+    def to_list(self):
+        urls = list(self.head)
+        for segment_path in self.segments:
+            with open(segment_path) as segment_file:
+                urls += segment_file.read().splitlines()
+        return urls + list(self.tail)
+
 class Queue():
     """
         This class impliments a minimal queue data structure capable of storing any type of data.
+        Backed by a collections.deque, add, remove and len are O(1).
 
         use:
             q = Queue()         # create queue
@@ -96,56 +521,30 @@ class Queue():
     """
 
     def __init__(self):
-        self.head, self.tail = None, None
-        self.node = lambda data, next: {'data':data, 'next':next}
+        self.items = collections.deque()
 
     def add(self, data):
         """
         :param data: Data (any type) to add to the tail of queue.
         """
-        n = self.node(data, None)
-
-        if self.head == None:
-            self.head, self.tail = n, n
-
-        else:
-            self.tail['next'] = n
-            self.tail = n
+        self.items.append(data)
 
     def remove(self):
         """
         :returns: Returns and removes data at the head of the queue or None.
         """
-        if self.head is not None:
-            n = self.head
-            self.head = n['next']
-            return n['data']
+        if len(self.items) > 0:
+            return self.items.popleft()
         return None
 
     def __len__(self):
-        count = 0
-        cur = self.head
-        while cur is not None:
-            cur = cur['next']
-            count +=1
-        return count
+        return len(self.items)
 
     def __contains__(self, key):
-        in_queue = False
-        cur = self.head
-        while cur is not None:
-            if cur['data'] == key:
-                in_queue = True
-            cur = cur['next']
-        return in_queue
+        return key in self.items
 
     def to_list(self):
-        queue_list = []
-        cur = self.head
-        while cur is not None:
-            queue_list.append(cur['data'])
-            cur = cur['next']
-        return queue_list
+        return list(self.items)
 
 """
     Filter Sites In Bounds and out of bounds
@@ -174,31 +573,144 @@ def filter_sub_directories(list_check_urls, list_parent_urls, filter_if_sub=Fals
         get_child = lambda check_url: sub_directory(check_url, parent)
         child_urls += list(filter(get_child, list_check_urls))
 
+    # keep the order urls were found in so frontier order (and id assignment) is reproducible
     child_urls = set(child_urls)
+    unique_check_urls = list(dict.fromkeys(list_check_urls))
     if filter_if_sub:
-        return list(set(list_check_urls).difference(child_urls))
-    return list(child_urls)
+        return [url for url in unique_check_urls if url not in child_urls]
+    return [url for url in unique_check_urls if url in child_urls]
 
 """
     Persistent URL resolver MAP
 """
-class URL_Resolver():
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def remove_dot_segments(path):
+    """ Resolve "." and ".." segments of a url path (RFC 3986 5.2.4). """
+    segments = []
+    for segment in path.split('/'):
+        if segment == '..':
+            if len(segments) > 1:
+                segments.pop()
+        elif segment != '.':
+            segments.append(segment)
+
+    # a path ending in "." or ".." names a directory
+    if path.endswith(('/.', '/..')):
+        segments.append('')
+    return '/'.join(segments)
+
+
+def canonicalize_url(url):
+    """ Local normal form of a url, no network: lower case scheme and host, no default port, no fragment,
+        no "." or ".." path segments, and "/" for an empty path. """
+    try:
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        host = parts.hostname or ''
+        port = parts.port
+    except ValueError:
+        return url
+
+    # hostname drops the brackets of an IPv6 address
+    if ':' in host:
+        host = "[%s]" % host
+
+    netloc = host
+    if port is not None and port != DEFAULT_PORTS.get(scheme):
+        netloc = "%s:%d" % (host, port)
+    if parts.username is not None:
+        credentials = parts.username if parts.password is None else "%s:%s" % (parts.username, parts.password)
+        netloc = "%s@%s" % (credentials, netloc)
+
+    path = remove_dot_segments(parts.path) if parts.path else '/'
+    return urlunsplit((scheme, netloc, path, parts.query, ''))
+
+
+class URL_Resolver(Journaled_Map):
+    """
+        Maps urls to the url they finally resolve to after redirects.
+
+        resolution methods:
+            "get"       full GET request, downloads the response body
+            "head"      HEAD request following redirects, falls back to "stream" if the server refuses HEAD
+            "stream"    streamed GET request closed as soon as the headers arrive, the body is never read
+            "offline"   no network, answers from the loaded map (by the url as written, or by canonical form
+                        through an index of the map built on first use).
+                        urls not in the map resolve to their canonical form, are collected in unresolved_urls
+                        and are not added to the map
+    """
 
-    def __init__(self):
+    def __init__(self, method="head", workers=1):
+        """
+        :param method: one of resolution_methods().
+        :param workers: number of urls resolve_list resolves concurrently.
+        """
         self.url_resolution_map = {}
+        self.method = method
+        self.workers = workers
+        self.journal = None
+        self.lock = threading.Lock()
+        self.unresolved_urls = set()
+
+        # canonical url -> resolved url, built from the map on the first offline lookup
+        self.canonical_resolution_map = None
+
+    @staticmethod
+    def resolution_methods():
+        return ["get", "head", "stream", "offline"]
+
+    def configure(self, method=None, workers=None):
+        if method is not None:
+            self.method = method
+        if workers is not None:
+            self.workers = workers
 
     def _network_url_resolution(self, url):
         try:
-            response = requests.get(url)
+            if self.method == "head":
+                response = http_client.head(url)
+                # some servers do not implement HEAD
+                if response.status_code in (405, 501):
+                    response = self._streamed_response(url)
+            elif self.method == "stream":
+                response = self._streamed_response(url)
+            else:
+                response = http_client.get(url)
+
             if response.url is None:
                 return url
             return response.url
         except:
             return url
 
+    def _streamed_response(self, url):
+        response = http_client.get(url, stream=True)
+        # only the final url is needed, release the connection without reading the body
+        response.close()
+        return response
+
+    def _add_resolution(self, url, resolved_url):
+        self.url_resolution_map[url] = resolved_url
+        self.canonical_resolution_map = None
+        self.journal_entry(url, resolved_url)
+
+    def _offline_url_resolution(self, url):
+        if self.canonical_resolution_map is None:
+            self.canonical_resolution_map = {canonicalize_url(mapped_url): resolved_url
+                                             for mapped_url, resolved_url in self.url_resolution_map.items()}
+        canonical_url = canonicalize_url(url)
+        if canonical_url in self.canonical_resolution_map:
+            return self.canonical_resolution_map[canonical_url]
+        self.unresolved_urls.add(url)
+        return canonical_url
+
     def resolve(self, url):
         if url not in self.url_resolution_map:
-            self.url_resolution_map[url] = self._network_url_resolution(url)
+            if self.method == "offline":
+                return self._offline_url_resolution(url)
+            self._add_resolution(url, self._network_url_resolution(url))
         return self.url_resolution_map[url]
 
     def resolve_list(self, list_of_urls, collapse=False):
@@ -207,14 +719,32 @@ class URL_Resolver():
         :return: list of resolved urls
         """
 
-        for url in list_of_urls:
-            if url not in self.url_resolution_map:
-                self.url_resolution_map[url] = self._network_url_resolution(url)
+        if self.method == "offline":
+            resolved_urls = [self.resolve(url) for url in list_of_urls]
+            if collapse:
+                return list(set(resolved_urls))
+            return resolved_urls
+
+        unresolved_urls = [url for url in dict.fromkeys(list_of_urls) if url not in self.url_resolution_map]
+
+        # resolve new urls in concurrent batches, the map itself is only written from this thread
+        if self.workers > 1 and len(unresolved_urls) > 1:
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(unresolved_urls))) as executor:
+                resolved_urls = list(executor.map(self._network_url_resolution, unresolved_urls))
+        else:
+            resolved_urls = [self._network_url_resolution(url) for url in unresolved_urls]
+
+        for url, resolved_url in zip(unresolved_urls, resolved_urls):
+            self._add_resolution(url, resolved_url)
 
         if collapse:
             return list(set([self.url_resolution_map[url] for url in list_of_urls]))
         return [self.url_resolution_map[url] for url in list_of_urls]
 
+    def lookup_list(self, list_of_urls):
+        """ Resolutions of urls already resolved, other urls as given. Never makes a request. """
+        return [self.url_resolution_map.get(url, url) for url in list_of_urls]
+
     def get_map(self):
         return self.url_resolution_map
 
@@ -225,12 +755,9 @@ class URL_Resolver():
         with open(file_path, 'w') as file:
             file.write(json.dumps(self.get_map()))
 
-    def load(self, file_path):
-        with open(file_path) as json_data:
-            self.url_resolution_map = json.load(json_data)
-
-
-
-
-
+    def snapshot(self):
+        return self.url_resolution_map
 
+    def restore(self, url, resolved_url):
+        self.url_resolution_map[url] = resolved_url
+        self.canonical_resolution_map = None
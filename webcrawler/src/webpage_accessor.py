@@ -4,7 +4,6 @@ __author__ = "L.J. Brown"
 __version__ = "1.0.1"
 
 import hashlib
-import requests
 from urllib.parse import urljoin
 import logging
 import sys
@@ -12,6 +11,7 @@ import sys
 # mylib
 from src import file_parser
 from src import text_processing
+from src import http_client
 
 # logging
 logging.basicConfig(level=logging.INFO)
@@ -38,7 +38,7 @@ def pull_summary(requested_url, included_attributes=("requested_url", "redirect_
     try:
 
         # make request
-        response = requests.get(requested_url)
+        response = http_client.get(requested_url)
 
         # set "status_code" value
         response_summary['status_code'] = response.status_code
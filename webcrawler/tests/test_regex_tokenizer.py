@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+
+__author__ = "L.J. Brown"
+__version__ = "1.0.1"
+
+import glob
+import json
+import os
+import unittest
+
+# external
+import nltk
+
+# my lib
+from src import text_processing
+
+"""
+    Tests of text_processing.regex_word_tokenize.
+
+    Expected words of regex_word_tokenize, run without any nltk data. And parity with nltk.word_tokenize, compared on
+    the tokens plain_text_to_tokens keeps, over the documents stored in collected_data. Documents are saved as term
+    frequency dictionaries, so each one is expanded back into text: every term repeated by its frequency, with the words
+    of stopwords.txt and punctuation between them. Parity is skipped when no documents are stored, or when the nltk
+    punkt or stopwords data it compares against is not installed.
+
+    use:
+        python -m pytest tests            (from the webcrawler directory)
+"""
+
+WEBCRAWLER_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORPUS_DIRECTORY = os.path.join(WEBCRAWLER_DIRECTORY, "collected_data")
+STOPWORDS_FILE = os.path.join(WEBCRAWLER_DIRECTORY, "stopwords.txt")
+
+# put between the words of an expanded document
+SEPARATORS = [" ", ", ", ". ", "; ", ": ", " -- ", "! ", "? ", " (", ") ", "'s ", " \"", "\" ", "... ", "\n"]
+
+
+def nltk_data_installed(*resource_names):
+    for resource_name in resource_names:
+        try:
+            nltk.data.find(resource_name)
+        except LookupError:
+            return False
+    return True
+
+
+def load_page_texts(corpus_directory=CORPUS_DIRECTORY, stopwords_file=STOPWORDS_FILE):
+    """ Returns one text per document stored in corpus_directory, its terms repeated by frequency between stop words and punctuation. """
+    with open(stopwords_file) as sf:
+        stopwords = sf.read().split()
+
+    texts = []
+    for document_file in sorted(glob.glob(os.path.join(corpus_directory, "*", "documents", "*.json"))):
+        with open(document_file) as df:
+            term_frequency_dict = json.load(df)['term_frequency_dict']
+        words = []
+        for term, frequency in sorted(term_frequency_dict.items()):
+            for _ in range(frequency):
+                for word in (term, stopwords[len(words) % len(stopwords)]):
+                    words.append(word)
+                    words.append(SEPARATORS[len(words) % len(SEPARATORS)])
+        texts.append(''.join(words) + '.')
+    return texts
+
+
+PUNKT_INSTALLED = nltk_data_installed('corpora/stopwords') and \
+                  (nltk_data_installed('tokenizers/punkt_tab') or nltk_data_installed('tokenizers/punkt'))
+
+PAGE_TEXTS = load_page_texts()
+
+
+class Regex_Tokenizer_Test(unittest.TestCase):
+
+    def assert_words(self, text, words):
+        self.assertEqual(words, text_processing.regex_word_tokenize(text), text)
+
+    def test_clitics(self):
+        self.assert_words("Don't panic, they'll say we can't.", ['Do', "n't", 'panic', 'they', 'll', 'say', 'we', 'ca', "n't"])
+        self.assert_words("Dallas's students' lounge", ['Dallas', 's', 'students', 'lounge'])
+        self.assert_words("I'd rather not, didn't's", ['I', 'd', 'rather', 'not', 'did', "n't", 's'])
+
+    def test_contractions(self):
+        self.assert_words("Gimme the gonna-wanna list, I cannot wait.",
+                          ['Gim', 'me', 'the', 'gon', 'na', '-', 'wan', 'na', 'list', 'I', 'can', 'not', 'wait'])
+
+    def test_numbers(self):
+        self.assert_words("Prices rose 3.5% to $1,250.00 on 12/01/2017 at 10:30am.",
+                          ['Prices', 'rose', '3.5', 'to', '1,250.00', 'on', '12/01/2017', 'at', '10:30am'])
+        self.assert_words("::new, a:b, 1:30", [':new', 'a', 'b', '1:30'])
+
+    def test_periods_and_dashes(self):
+        self.assert_words("Section 3.2 covers tf-idf; see Fig. 4.", ['Section', '3.2', 'covers', 'tf-idf', 'see', 'Fig', '4'])
+        self.assert_words("state-of-the-art systems -- like these... or not", ['state-of-the-art', 'systems', 'like', 'these', 'or', 'not'])
+
+    def test_addresses(self):
+        self.assert_words("E-mail fmoore@lyle.smu.edu or see https://lyle.smu.edu/~fmoore/index.htm",
+                          ['E-mail', 'fmoore', 'lyle.smu.edu', 'or', 'see', 'https', '//lyle.smu.edu/~fmoore/index.htm'])
+
+    def test_unicode_punctuation(self):
+        self.assert_words("“Quoted” ‘text’ – en dash — em dash «guillemets»", ['Quoted', 'text', 'en', 'dash', 'em', 'dash', 'guillemets'])
+
+
+@unittest.skipUnless(PAGE_TEXTS, "no documents are stored in collected_data")
+@unittest.skipUnless(PUNKT_INSTALLED, "nltk punkt and stopwords data are not installed")
+class Regex_Tokenizer_Parity_Test(unittest.TestCase):
+
+    def assert_same_tokens(self, text):
+        self.assertEqual(text_processing.plain_text_to_tokens(text, tokenizer="nltk"),
+                         text_processing.plain_text_to_tokens(text, tokenizer="regex"), text)
+
+    def test_page_texts(self):
+        for text in PAGE_TEXTS:
+            with self.subTest(text=text[:80]):
+                self.assert_same_tokens(text)
+
+    def test_joined_page_texts(self):
+        self.assert_same_tokens(' '.join(PAGE_TEXTS))
+
+
+if __name__ == '__main__':
+    unittest.main()